@@ -0,0 +1,21 @@
+"""
+ASGI config for VideoEm project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Requests are routed by VideoEm.asgi_urls: the async versions of the Telegram-bound views
+(aproxy_video, AsyncGetInvoiceAPI, atelegram_webhook) run on the event loop, DB-bound sync
+views run in Django's thread pool. WSGI keeps the sync views of VideoEm.urls.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'VideoEm.settings')
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'VideoEm.asgi_urls')
+
+application = get_asgi_application()
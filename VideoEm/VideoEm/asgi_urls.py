@@ -0,0 +1,19 @@
+"""
+URL configuration served by VideoEm.asgi.
+
+Same routes as VideoEm.urls, with the Telegram-bound views replaced by their async versions.
+They are listed first, so they shadow the sync views under the same paths and names.
+"""
+
+from django.urls import path
+
+from VideoEm import urls
+from video_app.views import AsyncGetInvoiceAPI, aproxy_video, atelegram_webhook
+
+urlpatterns = [
+    path('proxy/<str:video_id>/', aproxy_video, name='proxy_video'),
+    path('api/v1/invoice_link', AsyncGetInvoiceAPI.as_view(), name='invoice_link'),
+    path('webhook/', atelegram_webhook, name='telegram_webhook'),
+] + urls.urlpatterns
+
+handler404 = urls.handler404
@@ -1,8 +1,8 @@
 from celery.schedules import schedule
 
 
-class ImmediateThenHourly(schedule):
-    """Runs immediately on first call, then hourly."""
+class ImmediateThenPeriodic(schedule):
+    """Runs immediately on first call, then every run_every seconds."""
     def is_due(self, last_run_at):
         if last_run_at is None:
             return True, self.seconds
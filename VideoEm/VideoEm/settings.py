@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
-from .celery_utils import ImmediateThenHourly
+from celery.schedules import crontab
+from .celery_utils import ImmediateThenPeriodic
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,7 +32,7 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
-STATIC_VERSION = "12"
+STATIC_VERSION = "17"
 
 # Application definition
 
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     'video_app.apps.VideoAppConfig',
     'rest_framework',
@@ -57,7 +60,8 @@ MIDDLEWARE = [
     'video_app.middleware.RequestLoggingMiddleware',
 ]
 
-ROOT_URLCONF = 'VideoEm.urls'
+# VideoEm.asgi switches to VideoEm.asgi_urls, which routes the async versions of the Telegram-bound views
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', 'VideoEm.urls')
 
 TEMPLATES = [
     {
@@ -99,30 +103,196 @@ LOGGING = {
 }
 
 WSGI_APPLICATION = 'VideoEm.wsgi.application'
+ASGI_APPLICATION = 'VideoEm.asgi.application'
+
+# The default cache keeps up to L1_MAX_ENTRIES values in each process for L1_TIMEOUT seconds in front of
+# Redis, writes are broadcast over Redis pub/sub so every process drops its local copy
+# Cached values are encoded with orjson (pickle for anything else) and compressed with zstd when
+# they are at least COMPRESS_MIN_LENGTH bytes long. API responses and rendered pages get their own
+# aliases so that thresholds and levels can be tuned per kind of payload, see the cache_benchmark command.
+CACHE_REDIS_OPTIONS = {
+    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+    "SERIALIZER": "video_app.cache_serializers.OrjsonSerializer",
+    "COMPRESSOR": "video_app.cache_serializers.ZstdThresholdCompressor",
+    "L1_MAX_ENTRIES": 10000,
+    "L1_TIMEOUT": 5,
+}
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "video_app.two_tier_cache.TwoTierRedisCache",
         "LOCATION": "redis://redis:6379/1",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            **CACHE_REDIS_OPTIONS,
+            "COMPRESS_MIN_LENGTH": 1024,
+            "COMPRESS_LEVEL": 3,
         },
         "KEY_PREFIX": "videoem_",
-    }
+    },
+    "api": {
+        "BACKEND": "video_app.two_tier_cache.TwoTierRedisCache",
+        "LOCATION": "redis://redis:6379/1",
+        "OPTIONS": {
+            **CACHE_REDIS_OPTIONS,
+            "COMPRESS_MIN_LENGTH": 512,
+            "COMPRESS_LEVEL": 3,
+        },
+        "KEY_PREFIX": "videoem_api_",
+    },
+    "pages": {
+        "BACKEND": "video_app.two_tier_cache.TwoTierRedisCache",
+        "LOCATION": "redis://redis:6379/1",
+        "OPTIONS": {
+            **CACHE_REDIS_OPTIONS,
+            "COMPRESS_MIN_LENGTH": 256,
+            "COMPRESS_LEVEL": 6,
+            "L1_MAX_ENTRIES": 1000,
+        },
+        "KEY_PREFIX": "videoem_pages_",
+    },
 }
+API_CACHE_ALIAS = "api"
+PAGE_CACHE_ALIAS = "pages"
+
+# API response caches serve entries up to API_CACHE_STALE_TTL seconds past their timeout while a single
+# worker, holding a lock for at most API_CACHE_LOCK_TIMEOUT seconds, recomputes them. Entries are
+# refreshed early with a probability growing with API_CACHE_BETA and the recomputation time.
+# On a cold miss other workers wait up to API_CACHE_WAIT seconds for the one computing.
+API_CACHE_STALE_TTL = 60
+API_CACHE_LOCK_TIMEOUT = 10
+API_CACHE_BETA = 1.0
+API_CACHE_WAIT = 2
+
+# Text search configuration of the video search vectors. 'russian' stems Russian words and
+# English ones with the english stemmer. Changing it requires the rebuild_search_vectors command.
+SEARCH_CONFIG = 'russian'
+# Pages of search results are cached as id lists for SEARCH_CACHE_TIMEOUT seconds,
+# the videos on them as separate rows for SEARCH_ROW_CACHE_TIMEOUT seconds.
+SEARCH_CACHE_TIMEOUT = 60 * 10
+SEARCH_ROW_CACHE_TIMEOUT = 60 * 10
+
+# Autocomplete suggests up to AUTOCOMPLETE_LIMIT tags and titles once AUTOCOMPLETE_MIN_LENGTH characters
+# are typed. Its queries are cancelled after AUTOCOMPLETE_TIMEOUT_MS, results are cached per prefix.
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_MAX_LENGTH = 50
+AUTOCOMPLETE_TIMEOUT_MS = 150
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 10
 
 CELERY_BROKER_URL = 'redis://redis:6379/2'
 CELERY_RESULT_BACKEND = 'redis://redis:6379/3'
 CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_ENABLE_UTC = False
 
+# Views are buffered in Redis and written to Video.view_count every VIEW_COUNT_FLUSH_INTERVAL seconds,
+# one UPDATE per VIEW_COUNT_FLUSH_BATCH_SIZE videos. A flush holds a Redis lock for at most
+# VIEW_COUNT_FLUSH_LOCK_TIMEOUT seconds, so overlapping beat runs never apply the same batch twice
+VIEW_COUNT_FLUSH_INTERVAL = 30
+VIEW_COUNT_FLUSH_BATCH_SIZE = 500
+VIEW_COUNT_FLUSH_LOCK_TIMEOUT = 300
+
+# Watching history is queued in a Redis stream (capped at about HISTORY_STREAM_MAXLEN entries) and
+# written every HISTORY_FLUSH_INTERVAL seconds in batches of HISTORY_FLUSH_BATCH_SIZE rows. Entries
+# left unacknowledged by a dead worker for HISTORY_STREAM_CLAIM_IDLE seconds are written by the next flush.
+HISTORY_STREAM_MAXLEN = 1000000
+HISTORY_FLUSH_INTERVAL = 5
+HISTORY_FLUSH_BATCH_SIZE = 1000
+HISTORY_FLUSH_MAX_BATCHES = 50
+HISTORY_STREAM_CLAIM_IDLE = 60
+
+# WatchingHistory is partitioned by month: partitions are created HISTORY_PARTITIONS_AHEAD months ahead,
+# views are rolled up per video and day, raw partitions older than HISTORY_RETENTION_MONTHS are dropped
+HISTORY_PARTITIONS_AHEAD = 3
+HISTORY_RETENTION_MONTHS = 6
+
+# Temporary links live for at least an hour. Every TEMP_LINK_RENEWAL_INTERVAL seconds links expiring
+# within TEMP_LINK_RENEWAL_WINDOW are renewed, so the window must be longer than the interval.
+TEMP_LINK_TTL = 60 * 60
+TEMP_LINK_RENEWAL_INTERVAL = 60 * 10
+TEMP_LINK_RENEWAL_WINDOW = 60 * 15
+
+# Links of the TEMP_LINK_HOT_SET_SIZE most accessed videos are renewed ahead of expiry. Links of other
+# videos are renewed by the proxy when they expire within TEMP_LINK_ACCESS_MARGIN, unless
+# TEMP_LINK_RENEW_COLD turns the sweep over the whole table back on.
+TEMP_LINK_HOT_SET_SIZE = 5000
+TEMP_LINK_ACCESS_MARGIN = 60 * 15
+TEMP_LINK_RENEW_COLD = False
+
+# Access scores are multiplied by the factor every hour, videos below the minimum leave the hot set
+VIDEO_HEAT_DECAY_FACTOR = 0.5
+VIDEO_HEAT_MIN_SCORE = 0.5
+
+# On-disk cache of proxied videos: segments of VIDEO_CACHE_SEGMENT_SIZE bytes keyed by video_id,
+# least recently used segments are evicted every VIDEO_CACHE_TRIM_INTERVAL seconds when the cache
+# grows over VIDEO_CACHE_MAX_SIZE bytes
+VIDEO_CACHE_DIR = BASE_DIR / 'video_cache'
+VIDEO_CACHE_MAX_SIZE = 2 * 1024 ** 3
+VIDEO_CACHE_SEGMENT_SIZE = 1024 ** 2
+VIDEO_CACHE_TRIM_INTERVAL = 60
+
 CELERY_BEAT_SCHEDULE = {
-    'run-every-hour': {
-        'task': 'video_app.tasks.update_links',
-        'schedule': ImmediateThenHourly(3660),
+    'warm-popular-links': {
+        'task': 'video_app.tasks.warm_popular_links',
+        'schedule': ImmediateThenPeriodic(TEMP_LINK_RENEWAL_INTERVAL),
+    },
+    'decay-video-heat': {
+        'task': 'video_app.tasks.decay_video_heat',
+        'schedule': 60 * 60,
+    },
+    'flush-view-counts': {
+        'task': 'video_app.tasks.flush_view_counts',
+        'schedule': VIEW_COUNT_FLUSH_INTERVAL,
+    },
+    'flush-watching-history': {
+        'task': 'video_app.tasks.flush_watching_history',
+        'schedule': HISTORY_FLUSH_INTERVAL,
+    },
+    'trim-video-cache': {
+        'task': 'video_app.tasks.trim_video_cache',
+        'schedule': VIDEO_CACHE_TRIM_INTERVAL,
+    },
+    'maintain-watching-history': {
+        'task': 'video_app.tasks.maintain_watching_history',
+        'schedule': crontab(hour=4, minute=0),
     },
 }
 
+if TEMP_LINK_RENEW_COLD:
+    CELERY_BEAT_SCHEDULE['renew-expiring-links'] = {
+        'task': 'video_app.tasks.update_links',
+        'schedule': ImmediateThenPeriodic(TEMP_LINK_RENEWAL_INTERVAL),
+    }
+
+# Temporary link renewal: parallel requests to Telegram and rows per bulk_update
+TEMP_LINK_RENEWAL_CONCURRENCY = 16
+TEMP_LINK_RENEWAL_BATCH_SIZE = 200
+# Width of the primary key range handled by one renew_links_range task
+TEMP_LINK_RENEWAL_RANGE_SIZE = 5000
+
+# Telegram Bot API client: (connect, read) timeouts in seconds, pooled connections per process,
+# retries with exponential backoff on 5xx and 429 (waiting at most MAX_RETRY_AFTER seconds),
+# circuit breaker opening after CIRCUIT_THRESHOLD consecutive failures for CIRCUIT_RESET seconds
+# and a token bucket of RATE requests per second shared through Redis by all processes
+TELEGRAM_API_TIMEOUT = (3.05, 10)
+TELEGRAM_API_POOL_SIZE = 32
+TELEGRAM_API_ASYNC_POOL_SIZE = 256
+TELEGRAM_API_RETRIES = 3
+TELEGRAM_API_BACKOFF = 0.5
+TELEGRAM_API_MAX_RETRY_AFTER = 5
+TELEGRAM_API_CIRCUIT_THRESHOLD = 5
+TELEGRAM_API_CIRCUIT_RESET = 30
+TELEGRAM_API_RATE = 25
+TELEGRAM_API_BURST = 30
+TELEGRAM_API_RATE_WAIT = 5
+
+# Bytes per chunk streamed by proxy_video
+PROXY_VIDEO_CHUNK_SIZE = 64 * 1024
+
+# Download links resolved by proxy_video are cached in Redis until they near expiry and in each process
+# for at most FILE_LINK_LOCAL_CACHE_TTL seconds
+FILE_LINK_LOCAL_CACHE_SIZE = 10000
+FILE_LINK_LOCAL_CACHE_TTL = 60 * 5
+
 
 DATABASES = {
     'default': {
@@ -22,8 +22,8 @@ from django.urls import path, include
 
 from VideoEm import settings
 from video_app.views import page_not_found, VideoAddAPIPost, VideoAPIGet, MyHistoryAPIGet, UserAPIGet, \
-    VideoAPIPatch, HistoryAddAPIPost, SubscriptionAPI, GetInvoiceAPI, RegisterAPI, SearchAPI, TagsAPICreate, \
-    TagsAPIGet, telegram_webhook
+    VideoAPIPatch, ViewAddAPIPost, HistoryAddAPIPost, SubscriptionAPI, GetInvoiceAPI, RegisterAPI, SearchAPI, TagsAPICreate, \
+    TagsAPIGet, CacheStatsAPI, AutocompleteAPIGet, telegram_webhook
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -33,13 +33,16 @@ urlpatterns = [
     path('api/v1/watched_videos', MyHistoryAPIGet.as_view(), name='watched_videos_list'),
     path('api/v1/user_get/<int:telegram_id>', UserAPIGet.as_view(), name='user_get'),
     path('api/v1/update_video/<str:video_id>', VideoAPIPatch.as_view(), name='update_views'),
+    path('api/v1/view_add/<str:video_id>', ViewAddAPIPost.as_view(), name='view_add'),
     path('api/v1/history_add', HistoryAddAPIPost.as_view(), name='history_add'),
     path('api/v1/subscriptions', SubscriptionAPI.as_view(), name='subscriptions'),
     path('api/v1/invoice_link', GetInvoiceAPI.as_view(), name='invoice_link'),
     path('api/v1/register_user', RegisterAPI.as_view(), name='register'),
     path('api/v1/search', SearchAPI.as_view(), name='search'),
+    path('api/v1/autocomplete', AutocompleteAPIGet.as_view(), name='autocomplete'),
     path('api/v1/create_tag', TagsAPICreate.as_view(), name='create_tag'),
     path('api/v1/get_tag', TagsAPIGet.as_view(), name='get_tag'),
+    path('api/v1/cache_stats', CacheStatsAPI.as_view(), name='cache_stats'),
     path('webhook/', telegram_webhook, name='telegram_webhook'),
 ]
 
@@ -6,6 +6,10 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, WebAppI
 from telegram.ext import CommandHandler, ContextTypes, filters, Application, MessageHandler, CallbackQueryHandler
 
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
+# (connect, read) timeouts in seconds for requests to the web app
+HTTP_TIMEOUT = (3.05, 10)
+
+http = requests.Session()
 
 web_app = WebAppInfo(url='<WEB_APP_URL>')
 
@@ -50,8 +54,8 @@ async def receive_video(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         if video:
             context.user_data['awaiting_video'] = False
             try:
-                response = requests.post(video_upload_endpoint,
-                                         json={'user_id': user_id, 'video_id': video.file_id})
+                response = http.post(video_upload_endpoint,
+                                     json={'user_id': user_id, 'video_id': video.file_id}, timeout=HTTP_TIMEOUT)
                 print({'user_id': user_id, 'video_id': video.file_id})
                 response.raise_for_status()
 
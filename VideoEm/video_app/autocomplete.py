@@ -0,0 +1,75 @@
+import logging
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import OperationalError
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+from . import cache_versions
+from .models import Tag, Video
+from .utils import statement_timeout
+
+logger = logging.getLogger('django')
+
+CACHE_KEY = 'autocomplete:{}:{}'
+
+cache = ConnectionProxy(caches, settings.API_CACHE_ALIAS)
+
+
+def normalize(prefix):
+    """ Lowercased prefix with collapsed whitespace, cut to AUTOCOMPLETE_MAX_LENGTH """
+    return re.sub(r'\s+', ' ', prefix).strip().lower()[:settings.AUTOCOMPLETE_MAX_LENGTH]
+
+
+def _matches(queryset, field, prefix, limit):
+    """
+    Values of field starting with prefix, then the closest fuzzy matches of prefix to a word of them.
+    Both conditions compare UPPER(field), so that the trigram GIN index on it serves them.
+    """
+    starts_with = Q(normalized__startswith=prefix.upper())
+    values = (queryset.annotate(normalized=Upper(field))
+              .filter(starts_with | Q(normalized__trigram_word_similar=prefix.upper()))
+              .annotate(is_prefix=Case(When(starts_with, then=Value(1)), default=Value(0),
+                                       output_field=IntegerField()),
+                        similarity=TrigramWordSimilarity(prefix.upper(), 'normalized'))
+              .order_by('-is_prefix', '-similarity')
+              .values_list(field, flat=True)[:limit * 2])
+    return list(dict.fromkeys(values))[:limit]
+
+
+def _suggest(prefix, limit):
+    with statement_timeout(settings.AUTOCOMPLETE_TIMEOUT_MS):
+        return {
+            'tags': _matches(Tag.objects.all(), 'tag', prefix, limit),
+            'titles': _matches(Video.published.all(), 'title', prefix, limit),
+        }
+
+
+def suggest(prefix, limit=None):
+    """
+    Tags and titles of published videos for what the user has typed so far, cached per prefix
+    for AUTOCOMPLETE_CACHE_TIMEOUT seconds in the tags and search namespaces. A miss is computed
+    right away, never waiting on another worker. Queries taking longer than AUTOCOMPLETE_TIMEOUT_MS
+    are cancelled and return no suggestions, which are not cached.
+    """
+    prefix = normalize(prefix)
+    limit = min(limit or settings.AUTOCOMPLETE_LIMIT, settings.AUTOCOMPLETE_LIMIT)
+    if len(prefix) < settings.AUTOCOMPLETE_MIN_LENGTH:
+        return {'tags': [], 'titles': []}
+
+    key = cache_versions.versioned_key(CACHE_KEY.format(limit, prefix), cache_versions.TAGS, cache_versions.SEARCH)
+    suggestions = cache.get(key)
+    if suggestions is not None:
+        return suggestions
+
+    try:
+        suggestions = _suggest(prefix, limit)
+    except OperationalError as e:
+        logger.warning(f"Autocomplete for {prefix!r} exceeded its time budget: {e}")
+        return {'tags': [], 'titles': []}
+    cache.set(key, suggestions, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return suggestions
@@ -0,0 +1,64 @@
+import pickle
+
+import orjson
+import pyzstd
+
+from django_redis.compressors.base import BaseCompressor
+from django_redis.exceptions import CompressorError
+from django_redis.serializers.base import BaseSerializer
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class OrjsonSerializer(BaseSerializer):
+    """
+    Serializes JSON compatible values (API responses, links, envelopes) with orjson and falls back
+    to pickle for anything else, such as the HttpResponse objects stored by cache_page.
+    A one byte tag tells the formats apart. Values with non-string keys or types orjson does not
+    know are pickled, datetimes come back as ISO strings.
+    """
+
+    JSON = b'j'
+    PICKLE = b'p'
+
+    def dumps(self, value):
+        try:
+            return self.JSON + orjson.dumps(value)
+        except TypeError:
+            return self.PICKLE + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, value):
+        tag, payload = value[:1], value[1:]
+        if tag == self.JSON:
+            return orjson.loads(payload)
+        if tag == self.PICKLE:
+            return pickle.loads(payload)
+        if tag == b'\x80':
+            # untagged pickle written before this serializer was configured
+            return pickle.loads(value)
+        raise ValueError(f"Unknown cache payload format {tag!r}")
+
+
+class ZstdThresholdCompressor(BaseCompressor):
+    """
+    Compresses payloads of at least COMPRESS_MIN_LENGTH bytes with zstd at COMPRESS_LEVEL.
+    Smaller payloads are stored as they are, compressing them costs more than it saves.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.level = options.get('COMPRESS_LEVEL', 3)
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        return pyzstd.compress(value, self.level)
+
+    def decompress(self, value):
+        if not value.startswith(ZSTD_MAGIC):
+            raise CompressorError("value is not compressed")
+        try:
+            return pyzstd.decompress(value)
+        except pyzstd.ZstdError as e:
+            raise CompressorError from e
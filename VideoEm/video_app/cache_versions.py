@@ -0,0 +1,64 @@
+import time
+
+from django.core.cache import cache
+
+# Every versioned key includes the global version, bumping it invalidates all of them
+GLOBAL = 'global'
+# Feed of all published videos
+PUBLISHED_VIDEOS = 'videos'
+TAGS = 'tags'
+# Search results, changing with the published set and the searched content of published videos
+SEARCH = 'search'
+
+VERSION_KEY = 'cache_version:{}'
+
+
+def user_videos(telegram_id):
+    """ Namespace of the feed of one uploader """
+    return f'videos:user:{telegram_id}'
+
+
+def user(telegram_id):
+    """ Namespace of one user's details """
+    return f'user:{telegram_id}'
+
+
+def subscriptions(telegram_id):
+    """ Namespace of the subscriptions of one user """
+    return f'subscriptions:{telegram_id}'
+
+
+def get_versions(namespaces):
+    """
+    Return the current version of every namespace, in one round trip when all of them exist.
+    A missing version starts from the current time in microseconds, so a namespace whose counter
+    was evicted never returns to a version older entries were stored under.
+    """
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns() // 1000, timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def versioned_key(base, *namespaces):
+    """
+    Cache key for base that changes whenever the global or any of the given namespaces is bumped.
+    """
+    versions = get_versions((GLOBAL, *namespaces))
+    return f'{base}:v{".".join(str(version) for version in versions)}'
+
+
+def bump(*namespaces):
+    """
+    Invalidate every key of the namespaces with one INCR each. Old entries are not deleted,
+    they are no longer read and expire by their own timeout.
+    """
+    for namespace in namespaces:
+        try:
+            cache.incr(VERSION_KEY.format(namespace))
+        except ValueError:
+            # never read, so nothing is cached under it
+            pass
@@ -0,0 +1,41 @@
+import hashlib
+
+import orjson
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def etag_for(data):
+    """
+    Strong ETag of response data: a hash of its canonical JSON form.
+    """
+    payload = orjson.dumps(data, option=orjson.OPT_SORT_KEYS, default=str)
+    return f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+
+def not_modified(request, etag):
+    """
+    Whether the client's If-None-Match already matches etag. Compared weakly, as RFC 9110 requires.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in (tag.removeprefix('W/') for tag in etags)
+
+
+def conditional_response(request, data, etag=None, status_code=status.HTTP_200_OK):
+    """
+    Response with data and its ETag, or an empty 304 if the client already has it.
+    Clients are asked to revalidate on every use, which costs them a 304 at most.
+    """
+    etag = etag or etag_for(data)
+    if not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data, status=status_code)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,172 @@
+import threading
+import time
+
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from .models import Video
+from .telegram_api import get_async_client, TelegramAPIError
+from .utils import get_new_temp_link
+
+LINK_KEY = 'file_link:{}'
+
+
+class LocalLinks:
+    """
+    Small per-process LRU of download links, so repeated plays of a video do not reach Redis.
+    Entries are dropped when their link is about to expire.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id):
+        with self._lock:
+            entry = self._links.get(video_id)
+            if entry is None:
+                return None
+            url, deadline = entry
+            if deadline <= time.monotonic():
+                del self._links[video_id]
+                return None
+            self._links.move_to_end(video_id)
+            return url
+
+    def set(self, video_id, url, timeout):
+        with self._lock:
+            self._links[video_id] = (url, time.monotonic() + timeout)
+            self._links.move_to_end(video_id)
+            while len(self._links) > self.max_size:
+                self._links.popitem(last=False)
+
+    def delete(self, video_id):
+        with self._lock:
+            self._links.pop(video_id, None)
+
+
+_local_links = LocalLinks(settings.FILE_LINK_LOCAL_CACHE_SIZE)
+
+
+def _usable_for(expires_at):
+    """
+    Seconds a link expiring at expires_at may still be handed out, 0 if it should be renewed.
+    """
+    if expires_at is None:
+        return 0
+    return max(0, int((expires_at - now()).total_seconds()) - settings.TEMP_LINK_ACCESS_MARGIN)
+
+
+def _stored_link(video):
+    temp_link, expires_at = video
+    timeout = _usable_for(expires_at)
+    return (temp_link, timeout) if temp_link and timeout else (None, 0)
+
+
+def _new_link_fields(temp_link):
+    fetched_at = now()
+    return {'temp_link': temp_link,
+            'temp_link_fetched_at': fetched_at,
+            'temp_link_expires_at': fetched_at + timedelta(seconds=settings.TEMP_LINK_TTL)}
+
+
+def _new_link_timeout():
+    return max(1, settings.TEMP_LINK_TTL - settings.TEMP_LINK_ACCESS_MARGIN)
+
+
+def video_exists(video_id):
+    """
+    Whether the video exists. A cached link is proof enough, since deleting a video forgets its link.
+    """
+    if _local_links.get(video_id) or cache.get(LINK_KEY.format(video_id)):
+        return True
+    return Video.objects.filter(video_id=video_id).exists()
+
+
+async def avideo_exists(video_id):
+    """
+    Async version of video_exists().
+    """
+    if _local_links.get(video_id) or await cache.aget(LINK_KEY.format(video_id)):
+        return True
+    return await Video.objects.filter(video_id=video_id).aexists()
+
+
+def resolve_link(video_id, refresh=False):
+    """
+    Return a download link for a video, or None if the video does not exist or Telegram has no link for it.
+    Looks in the process cache, then Redis, then the link stored on the video, and asks Telegram
+    only when none of them is valid for TEMP_LINK_ACCESS_MARGIN more seconds.
+    refresh=True skips the caches, used after Telegram rejected the cached link.
+    """
+    if not refresh:
+        url = _local_links.get(video_id)
+        if url:
+            return url
+        url = cache.get(LINK_KEY.format(video_id))
+        if url:
+            _local_links.set(video_id, url, settings.FILE_LINK_LOCAL_CACHE_TTL)
+            return url
+
+    video = Video.objects.filter(video_id=video_id).values_list('temp_link', 'temp_link_expires_at').first()
+    if video is None:
+        return None
+
+    url, timeout = (None, 0) if refresh else _stored_link(video)
+    if not url:
+        url = get_new_temp_link(video_id)
+        if not url:
+            return None
+        Video.objects.filter(video_id=video_id).update(**_new_link_fields(url))
+        timeout = _new_link_timeout()
+
+    cache.set(LINK_KEY.format(video_id), url, timeout)
+    _local_links.set(video_id, url, min(timeout, settings.FILE_LINK_LOCAL_CACHE_TTL))
+    return url
+
+
+async def aresolve_link(video_id, refresh=False):
+    """
+    Async version of resolve_link(), asks Telegram with the async client.
+    """
+    if not refresh:
+        url = _local_links.get(video_id)
+        if url:
+            return url
+        url = await cache.aget(LINK_KEY.format(video_id))
+        if url:
+            _local_links.set(video_id, url, settings.FILE_LINK_LOCAL_CACHE_TTL)
+            return url
+
+    video = await Video.objects.filter(video_id=video_id).values_list('temp_link', 'temp_link_expires_at').afirst()
+    if video is None:
+        return None
+
+    url, timeout = (None, 0) if refresh else _stored_link(video)
+    if not url:
+        try:
+            url = await get_async_client().get_file_url(video_id)
+        except TelegramAPIError:
+            url = None
+        if not url:
+            return None
+        await Video.objects.filter(video_id=video_id).aupdate(**_new_link_fields(url))
+        timeout = _new_link_timeout()
+
+    await cache.aset(LINK_KEY.format(video_id), url, timeout)
+    _local_links.set(video_id, url, min(timeout, settings.FILE_LINK_LOCAL_CACHE_TTL))
+    return url
+
+
+def forget_link(video_id):
+    """
+    Drop the cached link of a video, e.g. when the video is deleted.
+    Other processes keep their local copy for at most FILE_LINK_LOCAL_CACHE_TTL seconds.
+    """
+    _local_links.delete(video_id)
+    cache.delete(LINK_KEY.format(video_id))
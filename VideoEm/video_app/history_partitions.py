@@ -0,0 +1,176 @@
+"""
+Monthly range partitioning of WatchingHistory on watched_at.
+
+Partitions are named <table>_pYYYYMM and created ahead of time, rows outside every monthly
+partition land in <table>_default. Before a partition older than HISTORY_RETENTION_MONTHS
+is dropped its rows are rolled up into WatchingHistoryDaily.
+"""
+from datetime import date, datetime, time, timezone
+
+from django.db import connection
+
+from .models import TelegramUser, Video, WatchingHistory, WatchingHistoryDaily
+from .utils import statement_timeout
+
+TABLE = WatchingHistory._meta.db_table
+LEGACY_TABLE = f'{TABLE}_legacy'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def _bound(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = %s
+        """, [TABLE])
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    Return {month: partition name} of the existing monthly partitions.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+        """, [TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+
+    prefix = f'{TABLE}_p'
+    return {datetime.strptime(name[len(prefix):], '%Y%m').date(): name
+            for name in names if name.startswith(prefix)}
+
+
+def create_partition(cursor, month):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE}
+        FOR VALUES FROM (%s) TO (%s)
+    """, [_bound(month), _bound(add_months(month, 1))])
+
+
+def ensure_partitions(months_ahead, today=None):
+    """
+    Create the partitions of the current month and of the next months_ahead months.
+    Return the names of the created partitions.
+    """
+    current = month_start(today or date.today())
+    existing = list_partitions()
+    created = []
+    with connection.cursor() as cursor:
+        for i in range(months_ahead + 1):
+            month = add_months(current, i)
+            if month not in existing:
+                create_partition(cursor, month)
+                created.append(partition_name(month))
+    return created
+
+
+def rollup(start, end):
+    """
+    Aggregate history rows with start <= watched_at < end (dates, UTC) into WatchingHistoryDaily.
+    Days are recomputed as a whole, so rolling up the same range twice is harmless.
+    Runs without the connection's statement timeout, a month of history takes longer.
+    """
+    with statement_timeout(0), connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {WatchingHistoryDaily._meta.db_table} (video_id, day, views, viewers)
+            SELECT video_id, (watched_at AT TIME ZONE 'UTC')::date, COUNT(*), COUNT(DISTINCT user_id)
+            FROM {TABLE}
+            WHERE watched_at >= %s AND watched_at < %s
+            GROUP BY 1, 2
+            ON CONFLICT (video_id, day) DO UPDATE SET views = EXCLUDED.views, viewers = EXCLUDED.viewers
+        """, [_bound(start), _bound(end)])
+        return cursor.rowcount
+
+
+def drop_expired_partitions(retention_months, today=None):
+    """
+    Roll up and drop monthly partitions which ended more than retention_months months ago.
+    Return the names of the dropped partitions.
+    """
+    cutoff = add_months(month_start(today or date.today()), -retention_months)
+    dropped = []
+    for month, name in sorted(list_partitions().items()):
+        if month >= cutoff:
+            break
+        with statement_timeout(0):
+            rollup(month, add_months(month, 1))
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+        dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(months_ahead):
+    """
+    Replace the plain WatchingHistory table with a partitioned one holding the same rows.
+    Runs in one transaction, without the connection's statement timeout, and locks the table
+    for its duration, so it should be run in a maintenance window. The primary key becomes (id, watched_at), as Postgres requires
+    the partition key in every unique constraint.
+    """
+    video, user = Video._meta, TelegramUser._meta
+    with statement_timeout(0), connection.cursor() as cursor:
+        cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [TABLE])
+        indexes = cursor.fetchall()
+
+        cursor.execute(f"""
+            SELECT (MIN(watched_at) AT TIME ZONE 'UTC')::date, (MAX(watched_at) AT TIME ZONE 'UTC')::date
+            FROM {TABLE}
+        """)
+        first, last = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {name}_legacy')
+
+        cursor.execute(f"""
+            CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS INCLUDING IDENTITY)
+            PARTITION BY RANGE (watched_at)
+        """)
+        cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, watched_at)')
+        cursor.execute(f"""
+            ALTER TABLE {TABLE}
+            ADD FOREIGN KEY (video_id) REFERENCES {video.db_table} (video_id) DEFERRABLE INITIALLY DEFERRED,
+            ADD FOREIGN KEY (user_id) REFERENCES {user.db_table} (telegram_id) DEFERRABLE INITIALLY DEFERRED
+        """)
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+        month = month_start(first) if first else month_start(date.today())
+        end = add_months(month_start(max(last or date.today(), date.today())), months_ahead)
+        while month <= end:
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+
+        for name, definition in indexes:
+            # the definitions name the table, which is now the partitioned one; an index on it
+            # is created on every partition, present and future
+            if name != f'{TABLE}_pkey':
+                cursor.execute(definition)
+
+        cursor.execute(f"""
+            SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)
+        """, [TABLE])
+        cursor.execute(f'DROP TABLE {LEGACY_TABLE}')
@@ -0,0 +1,171 @@
+import logging
+import os
+import socket
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django_redis import get_redis_connection
+from redis.exceptions import ResponseError
+
+from .models import LastWatched, TelegramUser, Video, WatchingHistory
+
+logger = logging.getLogger('django')
+
+STREAM_KEY = 'watching_history:stream'
+GROUP = 'history_writers'
+# entries the database rejects are moved here for inspection instead of blocking the stream
+DEAD_LETTER_KEY = 'watching_history:dead'
+DEAD_LETTER_MAXLEN = 10000
+
+# errors caused by the entries themselves, which would fail the same way on every redelivery
+POISON_ERRORS = (IntegrityError, DataError)
+
+
+def append_watch(user_id, video_id, watched_at=None):
+    """
+    Queue one watching history entry. Entries are written to the database in batches by flush_history().
+    """
+    watched_at = watched_at or datetime.now(timezone.utc)
+    get_redis_connection('default').xadd(
+        STREAM_KEY,
+        {'user': user_id, 'video': video_id, 'ts': watched_at.timestamp()},
+        maxlen=settings.HISTORY_STREAM_MAXLEN,
+        approximate=True,
+    )
+
+
+def consumer_name():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+def _ensure_group(redis):
+    try:
+        redis.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+    except ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _parse(entries):
+    """
+    Turn stream entries into (entry_id, user_id, video_id, watched_at), skipping malformed ones.
+    """
+    parsed = []
+    for entry_id, fields in entries:
+        try:
+            parsed.append((entry_id,
+                           int(fields[b'user']),
+                           fields[b'video'].decode(),
+                           datetime.fromtimestamp(float(fields[b'ts']), timezone.utc)))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Dropping malformed history entry {entry_id}: {e}")
+    return parsed
+
+
+def _write(entries):
+    """
+    Insert entries whose user and video exist, with one query per table for the check,
+    and upsert the latest watch of every (user, video) pair into LastWatched, in one transaction,
+    so a redelivered batch never finds rows of a half-written one.
+    Return the number of inserted rows.
+    """
+    user_ids = {user_id for _, user_id, _, _ in entries}
+    video_ids = {video_id for _, _, video_id, _ in entries}
+    known_users = set(TelegramUser.objects.filter(telegram_id__in=user_ids).values_list('telegram_id', flat=True))
+    known_videos = set(Video.objects.filter(video_id__in=video_ids).values_list('video_id', flat=True))
+
+    rows = [WatchingHistory(user_id=user_id, video_id=video_id, watched_at=watched_at)
+            for _, user_id, video_id, watched_at in entries
+            if user_id in known_users and video_id in known_videos]
+    latest = {}
+    for row in rows:
+        key = (row.user_id, row.video_id)
+        if key not in latest or latest[key] < row.watched_at:
+            latest[key] = row.watched_at
+
+    with transaction.atomic():
+        WatchingHistory.objects.bulk_create(rows, batch_size=settings.HISTORY_FLUSH_BATCH_SIZE)
+        _upsert_last_watched(list(latest.items()))
+    return len(rows)
+
+
+def _write_or_dead_letter(redis, entries, parsed):
+    """
+    Write parsed entries. When the database rejects the batch, e.g. a video deleted after the
+    existence check, the entries are written one by one and those rejected again are moved to
+    the dead letter stream, so that they do not fail every following flush.
+    Errors of the database itself are raised, the batch is then redelivered.
+    """
+    try:
+        return _write(parsed)
+    except POISON_ERRORS as e:
+        logger.warning(f"History batch of {len(parsed)} entries rejected, writing them one by one: {e}")
+
+    fields = dict(entries)
+    written = 0
+    for entry in parsed:
+        try:
+            written += _write([entry])
+        except POISON_ERRORS as e:
+            logger.warning(f"Dead-lettering history entry {entry[0]}: {e}")
+            redis.xadd(DEAD_LETTER_KEY, {**fields[entry[0]], 'error': str(e)},
+                       maxlen=DEAD_LETTER_MAXLEN, approximate=True)
+    return written
+
+
+def _upsert_last_watched(latest):
+    """
+    Upsert ((user_id, video_id), watched_at) pairs into LastWatched, one statement per batch.
+    An existing entry only moves forward, so reclaimed or late entries never rewind it.
+    """
+    table = LastWatched._meta.db_table
+    batch_size = settings.HISTORY_FLUSH_BATCH_SIZE
+    with connection.cursor() as cursor:
+        for i in range(0, len(latest), batch_size):
+            batch = latest[i:i + batch_size]
+            cursor.execute(f"""
+                INSERT INTO {table} (user_id, video_id, last_watched)
+                VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}
+                ON CONFLICT (user_id, video_id)
+                DO UPDATE SET last_watched = GREATEST({table}.last_watched, EXCLUDED.last_watched)
+            """, [value for (user_id, video_id), watched_at in batch for value in (user_id, video_id, watched_at)])
+
+
+def flush_history(max_batches):
+    """
+    Move queued watching history into the database, at most max_batches batches per call.
+    Entries are read through a consumer group and acknowledged only after they are written,
+    so a worker dying mid-batch loses nothing: its entries are claimed by the next flush once
+    they were pending for HISTORY_STREAM_CLAIM_IDLE seconds. Delivery is at least once.
+    Entries the database rejects are dead-lettered and acknowledged, see _write_or_dead_letter().
+    Return the number of inserted rows.
+    """
+    redis = get_redis_connection('default')
+    _ensure_group(redis)
+    consumer = consumer_name()
+    batch_size = settings.HISTORY_FLUSH_BATCH_SIZE
+    written = 0
+
+    reclaimed = redis.xautoclaim(STREAM_KEY, GROUP, consumer, settings.HISTORY_STREAM_CLAIM_IDLE * 1000,
+                                 start_id='0-0', count=batch_size)[1]
+    batches = [reclaimed] if reclaimed else []
+
+    for _ in range(max_batches):
+        if not batches:
+            response = redis.xreadgroup(GROUP, consumer, {STREAM_KEY: '>'}, count=batch_size)
+            if not response:
+                break
+            batches.append(response[0][1])
+
+        entries = batches.pop()
+        parsed = _parse(entries)
+        if parsed:
+            written += _write_or_dead_letter(redis, entries, parsed)
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        redis.xack(STREAM_KEY, GROUP, *entry_ids)
+        redis.xdel(STREAM_KEY, *entry_ids)
+
+    return written
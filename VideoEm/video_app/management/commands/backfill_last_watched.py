@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from video_app.models import LastWatched, WatchingHistory
+from video_app.utils import statement_timeout
+
+
+class Command(BaseCommand):
+    help = "Fill LastWatched with the latest watch of every (user, video) pair from WatchingHistory"
+
+    def handle(self, *args, **options):
+        history = WatchingHistory._meta.db_table
+        last_watched = LastWatched._meta.db_table
+
+        # one pass over the whole history, longer than the connection's statement timeout
+        with statement_timeout(0), connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {last_watched} (user_id, video_id, last_watched)
+                SELECT user_id, video_id, MAX(watched_at)
+                FROM {history}
+                GROUP BY user_id, video_id
+                ON CONFLICT (user_id, video_id)
+                DO UPDATE SET last_watched = GREATEST({last_watched}.last_watched, EXCLUDED.last_watched)
+            """)
+            rows = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {rows} last watched entries"))
@@ -0,0 +1,156 @@
+import random
+import string
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django_redis.compressors.identity import IdentityCompressor
+from django_redis.exceptions import CompressorError
+from django_redis.serializers.pickle import PickleSerializer
+
+from video_app.cache_serializers import OrjsonSerializer, ZstdThresholdCompressor
+from video_app.models import Video
+from video_app.pagination import VideoCursorPagination
+from video_app.serializers import VideoGetSerializerBase
+
+PAGE_TEMPLATES = ['index.html', 'main.html', 'account.html', 'subscriptions.html', 'search.html',
+                  'tag_search.html', '404.html']
+
+
+class Codec:
+    """
+    Serializer and compressor pair, encoding the way the django-redis client does.
+    """
+
+    def __init__(self, serializer, compressor):
+        self.serializer = serializer
+        self.compressor = compressor
+
+    def encode(self, value):
+        return self.compressor.compress(self.serializer.dumps(value))
+
+    def decode(self, value):
+        try:
+            value = self.compressor.decompress(value)
+        except CompressorError:
+            pass
+        return self.serializer.loads(value)
+
+
+class Command(BaseCommand):
+    help = ("Compare size and encode/decode time of cached feed pages and rendered pages "
+            "under pickle, orjson and zstd, and under the serializer of every configured cache alias")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=50, help="Number of feed pages to encode")
+        parser.add_argument('--synthetic', action='store_true',
+                            help="Build feed pages from generated videos instead of the database")
+        parser.add_argument('--repeat', type=int, default=20, help="Encode/decode rounds per payload")
+
+    def handle(self, *args, **options):
+        feed = self.feed_pages(options['pages'], options['synthetic'])
+        html = self.rendered_pages()
+        codecs = self.codecs()
+
+        for name, payloads in (('API feed pages', feed), ('Rendered pages', html)):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}: {len(payloads)}"))
+            if not payloads:
+                continue
+            baseline = None
+            for codec_name, codec in codecs.items():
+                size, encode, decode = self.measure(codec, payloads, options['repeat'])
+                baseline = baseline or size
+                self.stdout.write(f"  {codec_name:<24} {size / len(payloads):>10.0f} B/page "
+                                  f"{baseline / size:>6.2f}x  encode {encode * 1e6:>8.1f} us  "
+                                  f"decode {decode * 1e6:>8.1f} us")
+
+    @staticmethod
+    def codecs():
+        zstd = {'COMPRESS_MIN_LENGTH': 0, 'COMPRESS_LEVEL': 3}
+        codecs = {
+            'pickle': Codec(PickleSerializer({}), IdentityCompressor({})),
+            'pickle+zstd': Codec(PickleSerializer({}), ZstdThresholdCompressor(zstd)),
+            'orjson': Codec(OrjsonSerializer({}), IdentityCompressor({})),
+            'orjson+zstd': Codec(OrjsonSerializer({}), ZstdThresholdCompressor(zstd)),
+        }
+        for alias, config in settings.CACHES.items():
+            options = config.get('OPTIONS', {})
+            if 'SERIALIZER' in options or 'COMPRESSOR' in options:
+                serializer = import_string(options.get('SERIALIZER', 'django_redis.serializers.pickle.PickleSerializer'))
+                compressor = import_string(options.get('COMPRESSOR', 'django_redis.compressors.identity.IdentityCompressor'))
+                codecs[f'alias {alias}'] = Codec(serializer(options), compressor(options))
+        return codecs
+
+    @staticmethod
+    def measure(codec, payloads, repeat):
+        """
+        Total encoded size and mean encode and decode time per payload.
+        """
+        encoded = [codec.encode(payload) for payload in payloads]
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for payload in payloads:
+                codec.encode(payload)
+        encode = (time.perf_counter() - started) / (repeat * len(payloads))
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for value in encoded:
+                codec.decode(value)
+        decode = (time.perf_counter() - started) / (repeat * len(payloads))
+        return sum(len(value) for value in encoded), encode, decode
+
+    def feed_pages(self, count, synthetic):
+        """
+        Feed pages wrapped in the response cache envelope, as VideoAPIGet stores them.
+        """
+        page_size = VideoCursorPagination.page_size
+        if synthetic:
+            videos = [self.synthetic_video(i) for i in range(count * page_size)]
+        else:
+            queryset = Video.published.select_related('user').order_by('-time_created')[:count * page_size]
+            videos = VideoGetSerializerBase(queryset, many=True).data
+            if not videos:
+                self.stdout.write(self.style.WARNING("No published videos, using synthetic ones"))
+                return self.feed_pages(count, True)
+
+        pages = []
+        for start in range(0, len(videos), page_size):
+            data = {
+                'next': f'http://videoem.local/api/v1/video_get/?cursor={"".join(random.choices(string.ascii_letters, k=24))}',
+                'previous': None,
+                'results': list(videos[start:start + page_size]),
+            }
+            pages.append({'data': data, 'soft_expires': time.time() + 300, 'delta': 0.05})
+        return pages
+
+    @staticmethod
+    def synthetic_video(i):
+        words = ['cat', 'dog', 'funny', 'music', 'cover', 'guitar', 'tutorial', 'travel', 'food', 'review']
+        title = ' '.join(random.choices(words, k=random.randint(2, 6))).capitalize()
+        return {
+            'title': title,
+            'user': str(random.randint(10 ** 8, 10 ** 10)),
+            'video_id': ''.join(random.choices(string.ascii_letters + string.digits + '_-', k=72)),
+            'time_created': timezone.now().isoformat(),
+            'is_published': True,
+            'view_count': random.randint(0, 100000),
+            'stars': random.randint(0, 500),
+            'time_published': timezone.now().isoformat(),
+            'video_slug': f'{title.lower().replace(" ", "-")}-{i}',
+            'description': ' '.join(random.choices(words, k=random.randint(0, 40))),
+            'tags': random.sample(range(1, 50), k=random.randint(0, 5)),
+            'username': random.choice(['Ivan Petrov', 'Anna', 'Dmitry K.', 'Maria Ivanova']),
+        }
+
+    @staticmethod
+    def rendered_pages():
+        """
+        Rendered page templates as HttpResponses, as cache_page stores them.
+        """
+        return [HttpResponse(render_to_string(f'video_app/{template}', {"show_back_button": True}))
+                for template in PAGE_TEMPLATES]
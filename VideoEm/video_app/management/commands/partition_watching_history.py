@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from video_app import history_partitions
+
+
+class Command(BaseCommand):
+    help = ("Create monthly WatchingHistory partitions ahead of time. "
+            "--convert turns the existing plain table into a partitioned one first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="Convert the plain table to a partitioned one (locks the table, run once)")
+        parser.add_argument('--ahead', type=int, default=settings.HISTORY_PARTITIONS_AHEAD,
+                            help="Number of future months to create partitions for")
+        parser.add_argument('--drop-expired', action='store_true',
+                            help="Roll up and drop partitions older than HISTORY_RETENTION_MONTHS")
+
+    def handle(self, *args, **options):
+        if options['convert']:
+            if history_partitions.is_partitioned():
+                raise CommandError("WatchingHistory is already partitioned")
+            history_partitions.convert_to_partitioned(options['ahead'])
+            self.stdout.write(self.style.SUCCESS("WatchingHistory converted to a partitioned table"))
+        elif not history_partitions.is_partitioned():
+            raise CommandError("WatchingHistory is not partitioned, run with --convert first")
+
+        created = history_partitions.ensure_partitions(options['ahead'])
+        self.stdout.write(f"Created partitions: {', '.join(created) or 'none'}")
+
+        if options['drop_expired']:
+            dropped = history_partitions.drop_expired_partitions(settings.HISTORY_RETENTION_MONTHS)
+            self.stdout.write(f"Dropped partitions: {', '.join(dropped) or 'none'}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from video_app.models import Video
+from video_app.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute the search vector of every video, in batches of primary keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Videos updated per UPDATE")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        updated = 0
+        last_pk = 0
+
+        while True:
+            pks = list(Video.objects.filter(pk__gt=last_pk).order_by('pk')
+                       .values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            updated += update_search_vectors(Video.objects.filter(pk__in=pks))
+            last_pk = pks[-1]
+            self.stdout.write(f"Updated {updated} videos")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search vectors of {updated} videos"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from video_app.models import TelegramUser, Video
+from video_app.utils import statement_timeout
+
+
+class Command(BaseCommand):
+    help = "Recompute stars_count, video_count and total_views of every user from their videos"
+
+    def handle(self, *args, **options):
+        videos = Video.objects.filter(user=OuterRef('telegram_id')).order_by().values('user')
+
+        def total(aggregate):
+            return Coalesce(Subquery(videos.annotate(total=aggregate).values('total')), Value(0))
+
+        # one UPDATE over every user, longer than the connection's statement timeout
+        with statement_timeout(0):
+            updated = TelegramUser.objects.update(
+                stars_count=total(Sum('stars')),
+                video_count=total(Count('pk')),
+                total_views=total(Sum('view_count')),
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted counters of {updated} users"))
@@ -1,6 +1,8 @@
 import logging
 import json
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
 logger = logging.getLogger('django')
 
 
@@ -9,12 +11,30 @@ class RequestLoggingMiddleware:
     Middleware to log detailed information about incoming requests and responses.
     Logs request method, path, IP, headers, and body (for POST/PUT requests).
     Also logs the response status code.
+    Supports both sync and async requests, so async views stay async under ASGI.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        request_log = self.log_request(request)
+        response = self.get_response(request)
+        return self.log_response(request, response, request_log)
+
+    async def __acall__(self, request):
+        request_log = self.log_request(request)
+        response = await self.get_response(request)
+        return self.log_response(request, response, request_log)
+
+    def log_request(self, request):
 
         request_log = {
             'method': request.method,
@@ -42,8 +62,9 @@ class RequestLoggingMiddleware:
             except Exception as e:
                 request_log['body'] = f'Error parsing body: {str(e)}'
 
-        response = self.get_response(request)
+        return request_log
 
+    def log_response(self, request, response, request_log):
         response_log = {
             'status_code': response.status_code,
             'path': request.get_full_path(),
@@ -1,6 +1,12 @@
 import uuid
+from datetime import timedelta
 
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils.timezone import now
 
 
 class PublishedManager(models.Manager):
@@ -14,6 +20,8 @@ class TelegramUser(models.Model):
     telegram_id = models.PositiveBigIntegerField(unique=True)
     telegram_fullname = models.CharField(max_length=255)
     stars_count = models.PositiveIntegerField(default=0)
+    video_count = models.PositiveIntegerField(default=0)
+    total_views = models.PositiveBigIntegerField(default=0)
     time_create = models.DateTimeField(auto_now_add=True)
     subscriptions = models.ManyToManyField('self', through='Subscription', symmetrical=False,
                                            related_name='subscribers')
@@ -41,22 +49,16 @@ class Subscription(models.Model):
         return f"{self.from_user} -> {self.to_user}"
 
 
-class SlugWord(models.Model):
-    """ Table of words which used for search based on video titles """
-    word = models.CharField(max_length=50, db_index=True, unique=True)
-
-    objects = models.Manager()
-
-    def __str__(self):
-        return self.word
-
-
 class Tag(models.Model):
     """ Table of tags which used for search """
     tag = models.CharField(max_length=50, db_index=True, unique=True)
 
     objects = models.Manager()
 
+    class Meta:
+        # fuzzy and prefix matches for autocomplete, needs the pg_trgm extension
+        indexes = [GinIndex(OpClass(Upper('tag'), name='gin_trgm_ops'), name='tag_tag_upper_trgm')]
+
     def __str__(self):
         return self.tag
 
@@ -71,11 +73,14 @@ class Video(models.Model):
     view_count = models.PositiveIntegerField(default=0)
     stars = models.PositiveIntegerField(default=0)
     temp_link = models.TextField(null=True)
+    temp_link_fetched_at = models.DateTimeField(null=True)
+    temp_link_expires_at = models.DateTimeField(null=True)
     time_published = models.DateTimeField(null=True)
     video_slug = models.SlugField(default='', null=False)
     description = models.TextField(null=True)
-    slug_words = models.ManyToManyField(SlugWord, related_name='videos', blank=True)
     tags = models.ManyToManyField(Tag, blank=True)
+    # weighted title, tag names and description, maintained by signals (see search)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     objects = models.Manager()
     published = PublishedManager()
@@ -83,36 +88,90 @@ class Video(models.Model):
     class Meta:
         ordering = ['-time_published']
         indexes = [models.Index(fields=['time_published', 'stars', 'user_id', 'view_count', 'video_slug']),
-                   models.Index(models.F('time_published').desc(), name='time_published_desc')]
+                   models.Index(models.F('time_published').desc(), name='time_published_desc'),
+                   models.Index(fields=['temp_link_expires_at']),
+                   GinIndex(fields=['search_vector'], name='video_search_vector_gin',
+                            condition=models.Q(is_published=True)),
+                   GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='video_title_upper_trgm',
+                            condition=models.Q(is_published=True))]
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+    TEMP_LINK_FIELDS = ['temp_link', 'temp_link_fetched_at', 'temp_link_expires_at']
 
-        if self.video_slug:
-            words = set(self.video_slug.split('-'))
-            word_objs = [SlugWord.objects.get_or_create(word=word)[0] for word in words]
-            self.slug_words.set(word_objs)
+    def set_temp_link(self, temp_link, fetched_at=None):
+        """ Store a freshly fetched temporary link together with its fetch and expiry time """
+        self.temp_link = temp_link
+        self.temp_link_fetched_at = fetched_at or now()
+        self.temp_link_expires_at = self.temp_link_fetched_at + timedelta(seconds=settings.TEMP_LINK_TTL)
 
     def __str__(self):
         return self.title or f"Video {self.video_id}"
 
 class WatchingHistory(models.Model):
-    """ Table for write user watching history """
+    """ Table for write user watching history, partitioned by month on watched_at (see history_partitions) """
     video = models.ForeignKey('Video', to_field='video_id', on_delete=models.PROTECT)
     user = models.ForeignKey('TelegramUser', to_field='telegram_id', on_delete=models.PROTECT)
-    watched_at = models.DateTimeField(auto_now_add=True)
+    watched_at = models.DateTimeField(default=now)
 
     objects = models.Manager()
 
     class Meta:
         ordering = ['-watched_at']
-        indexes = [models.Index(models.F('watched_at').desc(), name='watched_at_desc'),
-                   models.Index(fields=['user', 'video'])]
+        indexes = [models.Index(models.F('watched_at').desc(), name='watched_at_desc')]
 
     def __str__(self):
         return f"{self.user} watched {self.video} at {self.watched_at}"
 
 
+class WatchingHistoryDaily(models.Model):
+    """ Views per video and day, rolled up from WatchingHistory before its old partitions are dropped """
+    video = models.ForeignKey('Video', to_field='video_id', on_delete=models.CASCADE)
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    viewers = models.PositiveIntegerField(default=0)
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['video', 'day'], name='history_daily_video_day')]
+
+    def __str__(self):
+        return f"{self.video} on {self.day}: {self.views} views"
+
+
+class LastWatched(models.Model):
+    """ Latest watch of each video by each user, kept up to date from WatchingHistory writes """
+    user = models.ForeignKey('TelegramUser', to_field='telegram_id', on_delete=models.CASCADE)
+    video = models.ForeignKey('Video', to_field='video_id', on_delete=models.CASCADE)
+    last_watched = models.DateTimeField()
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'video'], name='last_watched_user_video')]
+        indexes = [models.Index(models.F('user'), models.F('last_watched').desc(), name='last_watched_user_desc')]
+
+    def __str__(self):
+        return f"{self.user} last watched {self.video} at {self.last_watched}"
+
+
+class AppliedViewBatch(models.Model):
+    """
+    Batch of buffered views already added to the counters, written in the same transaction,
+    so that a flush retried after a crash skips the batches it committed
+    """
+    flush_id = models.UUIDField()
+    batch = models.CharField(max_length=32)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['flush_id', 'batch'], name='applied_view_batch_flush_batch')]
+
+    def __str__(self):
+        return f"View batch {self.batch} of flush {self.flush_id}"
+
+
 class Payment(models.Model):
     """ Table for users payments """
 
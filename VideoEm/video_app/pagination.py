@@ -1,4 +1,12 @@
-from rest_framework.pagination import CursorPagination
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class VideoCursorPagination(CursorPagination):
@@ -11,3 +19,57 @@ class HistoryCursorPagination(CursorPagination):
     page_size = 20
     ordering = '-watched_at'
     cursor_query_param = 'cursor'
+
+
+class RankedCursorPagination(BasePagination):
+    """
+    Forward only keyset pagination over ranked search results, ordered by (rank, published_at, id)
+    descending. The cursor holds the key of the last row of a page and the next page starts strictly
+    after it, so every page costs the same and rows never repeat or shift between pages.
+    The queryset must be annotated with rank and published_at.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = ('-rank', '-published_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        key = self.decode_cursor(request)
+        if key is not None:
+            queryset = queryset.filter(self.after(*key))
+
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    @staticmethod
+    def after(rank, published_at, pk):
+        """ Rows following the key (rank, published_at, pk) in descending order """
+        return (Q(rank__lt=rank)
+                | Q(rank=rank, published_at__lt=published_at)
+                | Q(rank=rank, published_at=published_at, id__lt=pk))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            rank, published_at, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return float(rank), datetime.fromisoformat(published_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        key = [instance.rank, instance.published_at.isoformat(), instance.pk]
+        encoded = base64.urlsafe_b64encode(json.dumps(key).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'previous': None, 'results': data})
@@ -0,0 +1,49 @@
+import logging
+
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('django')
+
+HEAT_KEY = 'video_heat'
+
+# Weight of a single access of each kind
+FEED_IMPRESSION = 1
+PROXY_HIT = 5
+WATCH = 10
+
+
+def record_hits(video_ids, weight):
+    """
+    Add weight to the heat of every video in video_ids.
+    Heat is kept in a Redis sorted set and is best effort: errors are logged, not raised.
+    """
+    if not video_ids:
+        return
+
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for video_id in video_ids:
+            pipe.zincrby(HEAT_KEY, weight, video_id)
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to record video hits: {e}")
+
+
+def hottest(limit):
+    """
+    Return video_ids of the limit most accessed videos, hottest first.
+    """
+    redis = get_redis_connection('default')
+    return [video_id.decode() for video_id in redis.zrevrange(HEAT_KEY, 0, limit - 1)]
+
+
+def decay_heat(factor, min_score):
+    """
+    Multiply every heat score by factor and forget videos which cooled down below min_score.
+    """
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline()
+    pipe.zunionstore(HEAT_KEY, {HEAT_KEY: factor})
+    pipe.zremrangebyscore(HEAT_KEY, '-inf', f'({min_score}')
+    pipe.execute()
@@ -0,0 +1,93 @@
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+from .conditional import conditional_response, etag_for
+
+LOCK_KEY = '{}:lock'
+
+cache = ConnectionProxy(caches, settings.API_CACHE_ALIAS)
+
+
+def _store(key, data, ttl, delta):
+    """
+    Store data in an envelope carrying its ETag, soft expiry and the time it took to compute.
+    The entry itself lives API_CACHE_STALE_TTL seconds longer, so it can be served stale.
+    """
+    entry = {'data': data, 'etag': etag_for(data), 'soft_expires': time.time() + ttl, 'delta': delta}
+    cache.set(key, entry, ttl + settings.API_CACHE_STALE_TTL)
+    return entry
+
+
+def _compute(key, compute, ttl):
+    started = time.monotonic()
+    data = compute()
+    return _store(key, data, ttl, time.monotonic() - started)
+
+
+def _is_fresh(entry):
+    """
+    Probabilistic early expiration (XFetch): the closer the soft expiry and the slower the
+    recomputation, the likelier an entry is treated as expired, so one request refreshes it
+    before it turns over for everybody.
+    """
+    early = entry['delta'] * settings.API_CACHE_BETA * -math.log(1 - random.random())
+    return time.time() + early < entry['soft_expires']
+
+
+def _recompute_locked(key, compute, ttl):
+    """
+    Recompute and store the entry if no other worker is doing it. Return None if one is.
+    """
+    lock_key = LOCK_KEY.format(key)
+    if not cache.add(lock_key, 1, settings.API_CACHE_LOCK_TIMEOUT):
+        return None
+    try:
+        return _compute(key, compute, ttl)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_entry(key, compute, ttl):
+    """
+    Return the cache envelope for key, computing its data with compute() when needed.
+    Fresh entries are returned as is. Stale ones are refreshed by a single worker
+    while the others keep serving the stale data. On a cold miss one worker computes and
+    the others wait up to API_CACHE_WAIT seconds for it before computing themselves.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        if _is_fresh(entry):
+            return entry
+        return _recompute_locked(key, compute, ttl) or entry
+
+    entry = _recompute_locked(key, compute, ttl)
+    if entry is not None:
+        return entry
+
+    deadline = time.monotonic() + settings.API_CACHE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return _compute(key, compute, ttl)
+
+
+def get_or_compute(key, compute, ttl):
+    """
+    Return the cached data for key, see get_entry().
+    """
+    return get_entry(key, compute, ttl)['data']
+
+
+def cached_response(request, key, compute, ttl):
+    """
+    Response for the cached data of key, or a 304 if the client has the version cached under its ETag.
+    """
+    entry = get_entry(key, compute, ttl)
+    return conditional_response(request, entry['data'], entry.get('etag'))
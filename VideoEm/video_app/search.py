@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Tag, Video
+
+
+def _tag_names():
+    """ Space separated tag names of the outer video """
+    return Subquery(Video.tags.through.objects.filter(video_id=OuterRef('pk'))
+                    .order_by().values('video_id')
+                    .annotate(names=StringAgg('tag__tag', ' '))
+                    .values('names'))
+
+
+def search_vector():
+    """
+    Document of a video: title, then tag names, then description, weighted in that order.
+    """
+    config = settings.SEARCH_CONFIG
+    return (SearchVector('title', weight='A', config=config)
+            + SearchVector(_tag_names(), weight='B', config=config)
+            + SearchVector('description', weight='C', config=config))
+
+
+def update_search_vectors(queryset):
+    """
+    Recompute the stored search vector of every video in the queryset with a single UPDATE.
+    """
+    return queryset.update(search_vector=search_vector())
+
+
+def search_videos(query):
+    """
+    Published videos matching a web search style query (words, "phrases", -exclusions, or),
+    annotated with their ts_rank as rank and their publication time as published_at, the keyset
+    of RankedCursorPagination. Uses the GIN index on search_vector.
+    """
+    search_query = SearchQuery(query, search_type='websearch', config=settings.SEARCH_CONFIG)
+    # double precision, so that ranks survive the round trip through pagination cursors
+    rank = Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    return (Video.published.filter(search_vector=search_query)
+            .annotate(rank=rank, published_at=Coalesce('time_published', 'time_created'))
+            .defer('search_vector')
+            .select_related('user')
+            .prefetch_related('tags'))
+
+
+def videos_with_tags(tag_names):
+    """
+    Published videos carrying every one of the named tags.
+    Names are resolved to ids first, then the video-tag rows of those tags alone are grouped by
+    video, keeping videos found once per tag, so the cost follows the size of the tags, not the catalog.
+    """
+    names = {name.strip() for name in tag_names if name.strip()}
+    tag_ids = list(Tag.objects.filter(tag__in=names).values_list('pk', flat=True))
+    if not names or len(tag_ids) < len(names):
+        return Video.objects.none()
+
+    matching = (Video.tags.through.objects.filter(tag_id__in=tag_ids)
+                .order_by().values('video_id')
+                .annotate(matched=Count('tag_id'))
+                .filter(matched=len(tag_ids))
+                .values('video_id'))
+    return (Video.published.filter(pk__in=matching)
+            .defer('search_vector')
+            .select_related('user')
+            .prefetch_related('tags'))
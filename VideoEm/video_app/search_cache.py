@@ -0,0 +1,109 @@
+import hashlib
+import re
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework.utils.urls import replace_query_param
+
+from . import cache_versions
+from .models import Video
+from .pagination import RankedCursorPagination, VideoCursorPagination
+from .response_cache import get_or_compute
+from .search import search_videos, videos_with_tags
+from .serializers import VideoGetSerializerBase, VideoGetSerializerWithTags
+
+RESULT_KEY = 'search_result:{}'
+ROW_KEY = 'search_row:{}:{}'
+
+# Rows of full-text results carry tag ids, rows of tag results tag names
+ROW_SERIALIZERS = {'text': VideoGetSerializerBase, 'tags': VideoGetSerializerWithTags}
+
+# websearch syntax whose meaning depends on word order: "phrases", -exclusions and or
+OPERATORS = re.compile(r'"|(^|\s)-|(^|\s)or(\s|$)')
+
+cache = ConnectionProxy(caches, settings.API_CACHE_ALIAS)
+
+
+def normalize_query(query):
+    """
+    Lowercased query with collapsed whitespace. Plain lists of terms, which match and rank the same
+    in any order, are reduced to their sorted distinct terms. Terms are kept whole, the parser of
+    the search configuration decides how "node.js" or "c++" are split.
+    """
+    query = ' '.join(query.lower().split())
+    if OPERATORS.search(query):
+        return query
+    return ' '.join(sorted(set(query.split())))
+
+
+def normalize_tags(tag_names):
+    """ Sorted distinct tag names """
+    return sorted({name.strip() for name in tag_names if name.strip()})
+
+
+def _page(queryset, paginator, request):
+    """
+    Ids of the requested page and the cursor of the next one.
+    Only the ordering columns are loaded, rows are hydrated from their own cache.
+    """
+    queryset = queryset.select_related(None).prefetch_related(None).only('id', 'time_created', 'time_published')
+    page = paginator.paginate_queryset(queryset, request)
+    next_link = paginator.get_next_link()
+    next_cursor = parse_qs(urlparse(next_link).query)[paginator.cursor_query_param][0] if next_link else None
+    return {'ids': [video.pk for video in page], 'next': next_cursor}
+
+
+def _rows(ids, kind):
+    """
+    Serialized videos in the order of ids, from the row cache or, for the missing ones, the database.
+    """
+    keys = {pk: ROW_KEY.format(kind, pk) for pk in ids}
+    rows = cache.get_many(list(keys.values()))
+
+    missing = [pk for pk in ids if keys[pk] not in rows]
+    if missing:
+        videos = list(Video.objects.filter(pk__in=missing)
+                      .defer('search_vector')
+                      .select_related('user')
+                      .prefetch_related('tags'))
+        data = ROW_SERIALIZERS[kind](videos, many=True).data
+        fetched = {keys[video.pk]: row for video, row in zip(videos, data)}
+        cache.set_many(fetched, settings.SEARCH_ROW_CACHE_TIMEOUT)
+        rows.update(fetched)
+
+    return [rows[keys[pk]] for pk in ids if keys[pk] in rows]
+
+
+def search_page(request, query=None, tags=None):
+    """
+    Page of full-text results for query, or of videos having all tags, as {next, previous, results}.
+
+    The ids of a page are cached under the normalized query or tag set and the cursor, in the
+    search namespace, which is bumped only when the published set or searchable content changes.
+    Videos are cached as separate rows, so updating one does not invalidate the searches listing it.
+    """
+    cursor = request.query_params.get('cursor', '')
+    if query is not None:
+        kind, normalized = 'text', normalize_query(query)
+        paginator = RankedCursorPagination()
+        compute = lambda: _page(search_videos(normalized), paginator, request)
+    else:
+        kind, normalized = 'tags', ','.join(normalize_tags(tags))
+        paginator = VideoCursorPagination()
+        compute = lambda: _page(videos_with_tags(normalized.split(',')), paginator, request)
+
+    digest = hashlib.blake2b(f'{kind}:{normalized}:{cursor}'.encode(), digest_size=16).hexdigest()
+    key = cache_versions.versioned_key(RESULT_KEY.format(digest), cache_versions.SEARCH)
+    page = get_or_compute(key, compute, settings.SEARCH_CACHE_TIMEOUT)
+
+    next_link = None
+    if page['next']:
+        next_link = replace_query_param(request.build_absolute_uri(), paginator.cursor_query_param, page['next'])
+    return {'next': next_link, 'previous': None, 'results': _rows(page['ids'], kind)}
+
+
+def forget_rows(video_ids):
+    """ Drop the cached rows of the videos, the next search listing them reads them again """
+    cache.delete_many([ROW_KEY.format(kind, pk) for pk in video_ids for kind in ROW_SERIALIZERS])
@@ -22,9 +22,6 @@ class VideoAddSerializer(serializers.ModelSerializer):
         try:
             temp_link = get_new_temp_link(validated_data["video_id"])
 
-            if temp_link:
-                validated_data['temp_link'] = temp_link
-
         except Exception as e:
             raise serializers.ValidationError({"video_id": f"Failed to generate temporary link: {str(e)}"})
 
@@ -33,7 +30,10 @@ class VideoAddSerializer(serializers.ModelSerializer):
         except TelegramUser.DoesNotExist:
             raise serializers.ValidationError({"user_id": "User with the given telegram_id does not exist."})
 
-        video = Video.objects.create(user=user, **validated_data)
+        video = Video(user=user, **validated_data)
+        if temp_link:
+            video.set_temp_link(temp_link)
+        video.save(force_insert=True)
 
         return video
 
@@ -48,24 +48,13 @@ class VideoGetSerializerBase(serializers.ModelSerializer):
     class Meta:
         model = Video
         fields = ['title', 'user', 'video_id', 'time_created', 'is_published', 'view_count', 'stars',
-                  'temp_link', 'time_published', 'video_slug', 'description', 'tags', 'username', 'slug_words']
+                  'time_published', 'video_slug', 'description', 'tags', 'username']
+        read_only_fields = ['view_count']
 
     def get_username(self, instance):
         return instance.user.telegram_fullname
 
 
-class VideoGetSerializerWithSlugwords(VideoGetSerializerBase):
-    """
-    Serializer for retrieving video details.
-    Includes slug words as read-only fields.
-    Using for casual search.
-    """
-    slug_words = serializers.SerializerMethodField()
-
-    def get_slug_words(self, instance):
-        return [slug_word.word for slug_word in instance.slug_words.all()]
-
-
 class VideoGetSerializerWithTags(VideoGetSerializerBase):
     """
     Serializer for retrieving video details.
@@ -81,17 +70,14 @@ class VideoGetSerializerWithTags(VideoGetSerializerBase):
 class UserSerializer(serializers.ModelSerializer):
     """
     Serializer for retrieving user details.
-    Includes video count as a read-only field.
+    Stars, video count and total views are counters maintained by signals and are read-only.
     """
-    video_count = serializers.SerializerMethodField()
 
     class Meta:
         model = TelegramUser
         fields = ['id', 'telegram_id', 'telegram_fullname', 'stars_count', 'time_create', 'subscriptions',
-                  'video_count']
-
-    def get_video_count(self, instance):
-        return instance.uploader.count()
+                  'video_count', 'total_views']
+        read_only_fields = ['stars_count', 'video_count', 'total_views']
 
 
 class WatchingHistorySerializer(serializers.ModelSerializer):
@@ -103,6 +89,15 @@ class WatchingHistorySerializer(serializers.ModelSerializer):
         fields = ['video', 'user']
 
 
+class WatchEventSerializer(serializers.Serializer):
+    """
+    Serializer for queueing a watching history entry.
+    User and video are checked in batch when the entry is written.
+    """
+    user = serializers.IntegerField(min_value=1)
+    video = serializers.CharField(max_length=255)
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     """
     Serializer for retrieving subscription details.
@@ -1,48 +1,206 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, post_init, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Sum
-from django.core.cache import cache
+from django.db.models import F
+from django.db.models.functions import Greatest
+from . import cache_versions
+from .file_links import forget_link
 from .models import Video, TelegramUser, Subscription, Tag
+from .search import update_search_vectors
+from .search_cache import forget_rows
+
+
+# Video fields the search vector is built from, besides tag names
+SEARCHED_FIELDS = {'title', 'description'}
+# Video fields summed into counters of the uploader
+COUNTED_FIELDS = {'stars': 'stars_count', 'view_count': 'total_views'}
+
+
+def _counted_values(instance):
+    """
+    Loaded values of the counted fields. Read from __dict__ so deferred fields are not fetched.
+    """
+    return {field: instance.__dict__.get(field) for field in ('user_id', *COUNTED_FIELDS)}
+
+
+def _searched_values(instance):
+    """
+    Current values of the searched fields. Read from __dict__ so deferred fields are not fetched.
+    """
+    return {field: instance.__dict__.get(field) for field in SEARCHED_FIELDS}
+
+
+def _add_to_user(user_id, **deltas):
+    """
+    Add deltas to counters of a user. Counters stop at 0: those of users created before they were
+    maintained start at 0 until recount_user_counters is run, and must not fail the save going below it.
+    """
+    deltas = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items() if delta}
+    if deltas:
+        TelegramUser.objects.filter(telegram_id=user_id).update(**deltas)
+        cache_versions.bump(cache_versions.user(user_id))
+
+
+@receiver(post_init, sender=Video)
+def remember_loaded_values(sender, instance, **kwargs):
+    """Remember counted values and publication as loaded, so that saves can apply only what changed"""
+    instance._counted = _counted_values(instance)
+    instance._was_published = instance.__dict__.get('is_published')
+    instance._searched = _searched_values(instance)
 
 
 @receiver(post_save, sender=Video)
+def update_user_counters(sender, instance, created, **kwargs):
+    """Add changes of video count, stars and views to the uploader's counters"""
+    current = _counted_values(instance)
+    previous = {} if created else instance._counted
+    moved = not created and None not in (previous['user_id'], current['user_id']) \
+        and previous['user_id'] != current['user_id']
+
+    if created or moved:
+        if moved:
+            _add_to_user(previous['user_id'], video_count=-1,
+                         **{counter: -(previous[field] or 0) for field, counter in COUNTED_FIELDS.items()})
+        _add_to_user(current['user_id'], video_count=1,
+                     **{counter: current[field] or 0 for field, counter in COUNTED_FIELDS.items()})
+    else:
+        deltas = {counter: current[field] - previous[field] for field, counter in COUNTED_FIELDS.items()
+                  if current[field] is not None and previous[field] is not None}
+        if any(deltas.values()):
+            _add_to_user(instance.user_id, **deltas)
+
+    instance._counted = current
+
+
 @receiver(post_delete, sender=Video)
-def update_user_stars_amount(sender, instance, **kwargs):
-    """Update user stars amount when someone added it to one of user`s video"""
-    user = instance.user
-    user.stars_count = user.uploader.aggregate(Sum('stars'))['stars__sum'] or 0
-    user.save()
+def remove_from_user_counters(sender, instance, **kwargs):
+    """Subtract a deleted video from the uploader's counters"""
+    _add_to_user(instance.user_id, video_count=-1,
+                 **{counter: -(getattr(instance, field) or 0) for field, counter in COUNTED_FIELDS.items()})
+
+
+@receiver(post_save, sender=Video)
+def update_video_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Rebuild the search vector of a created video or of one whose title or description changed,
+    e.g. not on likes or view counts. Tag changes are handled by update_search_vectors_on_tagging.
+    Connected before clear_video_cache, which remembers the saved values, and so that search
+    results are invalidated after the rebuild.
+    """
+    if update_fields is not None and not SEARCHED_FIELDS & set(update_fields):
+        return
+    if not created and _searched_values(instance) == instance._searched:
+        return
+    update_search_vectors(Video.objects.filter(pk=instance.pk))
+
+
+def _changes_search_results(instance, created, deleted):
+    """Whether a saved or deleted video enters, leaves or changes its text in the published set"""
+    if created:
+        return instance.is_published
+    if deleted or instance._was_published is None:
+        return instance._was_published is not False
+    if instance.is_published != instance._was_published:
+        return True
+    return instance.is_published and _searched_values(instance) != instance._searched
 
 
 @receiver(post_save, sender=Video)
 @receiver(post_delete, sender=Video)
-def clear_video_cache(sender, instance, **kwargs):
-    """Clear cache when videos are updated or deleted"""
-    keys = cache.keys('video_get:*')
-    if keys:
-        cache.delete_many(keys)
+def clear_video_cache(sender, instance, signal, created=False, **kwargs):
+    """
+    Invalidate the uploader's feed, the published feed if the video is or was in it,
+    search results if they may list it differently, and its cached search rows
+    """
+    deleted = signal is post_delete
+    namespaces = [cache_versions.user_videos(instance.user_id)]
+    if instance.is_published or instance._was_published is not False:
+        namespaces.append(cache_versions.PUBLISHED_VIDEOS)
+    if _changes_search_results(instance, created, deleted):
+        namespaces.append(cache_versions.SEARCH)
+    cache_versions.bump(*namespaces)
+    forget_rows([instance.pk])
+    instance._was_published = instance.is_published
+    instance._searched = _searched_values(instance)
+
+
+@receiver(post_delete, sender=Video)
+def forget_video_link(sender, instance, **kwargs):
+    """Stop proxying a deleted video"""
+    forget_link(instance.video_id)
 
 
 @receiver(post_save, sender=TelegramUser)
 @receiver(post_delete, sender=TelegramUser)
 def invalidate_user_cache_on_change(sender, instance, **kwargs):
-    """Clear cache when user info are updated or deleted"""
-    cache_key = f'user_api_get_{instance.telegram_id}'
-    cache.delete(cache_key)
+    """Clear cache when user info are updated or deleted, including search rows showing their name"""
+    cache_versions.bump(cache_versions.user(instance.telegram_id))
+    forget_rows(Video.objects.filter(user=instance.telegram_id).values_list('pk', flat=True))
 
 
 @receiver(post_save, sender=Subscription)
 @receiver(post_delete, sender=Subscription)
 def invalidate_subscription_cache_on_change(sender, instance, **kwargs):
     """Clear cache when subscription are updated or deleted"""
-    cache_key = f'subscription_{instance.from_user.telegram_id}'
-    cache.delete(cache_key)
+    cache_versions.bump(cache_versions.subscriptions(instance.from_user_id))
 
 
 @receiver(post_save, sender=Tag)
 @receiver(post_delete, sender=Tag)
-def invalidate_user_cache_on_change(sender, instance, **kwargs):
+def invalidate_tags_cache_on_change(sender, instance, **kwargs):
     """Clear cache when tags are added or deleted"""
-    cache_key = 'tags_api_get'
-    cache.delete(cache_key)
+    cache_versions.bump(cache_versions.TAGS)
+
+
+def _any_published(video_ids):
+    """Whether any of the videos is published, i.e. may be listed in search results"""
+    return Video.published.filter(pk__in=video_ids).exists()
+
 
+@receiver(m2m_changed, sender=Video.tags.through)
+def update_search_vectors_on_tagging(sender, instance, action, reverse, pk_set, **kwargs):
+    """Rebuild the search vectors of videos whose tags were added, removed or cleared"""
+    if action == 'pre_clear' and reverse:
+        # the videos of a tag are gone once it is cleared
+        instance._tagged_video_ids = list(instance.video_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            video_ids = [instance.pk]
+        elif action == 'post_clear':
+            video_ids = instance._tagged_video_ids
+        else:
+            video_ids = pk_set
+        update_search_vectors(Video.objects.filter(pk__in=video_ids))
+        forget_rows(video_ids)
+        # tags of unpublished videos are not searchable, their rows are forgotten all the same
+        published = _any_published(video_ids) if reverse else instance.is_published
+        if published:
+            cache_versions.bump(cache_versions.SEARCH)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_videos_of_deleted_tag(sender, instance, **kwargs):
+    """Remember the videos of a tag before its deletion removes it from them"""
+    instance._tagged_video_ids = list(instance.video_set.values_list('pk', flat=True))
+
+
+@receiver(post_init, sender=Tag)
+def remember_loaded_tag_name(sender, instance, **kwargs):
+    """Remember the tag name as loaded, so that saves which do not rename it are skipped"""
+    instance._loaded_name = instance.__dict__.get('tag')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def update_search_vectors_on_tag_change(sender, instance, signal, created=False, **kwargs):
+    """Rebuild the search vectors of videos carrying a renamed or deleted tag"""
+    renamed = instance.tag != instance._loaded_name
+    instance._loaded_name = instance.tag
+    if created or (signal is post_save and not renamed):
+        return
+    video_ids = getattr(instance, '_tagged_video_ids', None)
+    if video_ids is None:
+        video_ids = list(instance.video_set.values_list('pk', flat=True))
+    update_search_vectors(Video.objects.filter(pk__in=video_ids))
+    forget_rows(video_ids)
+    if _any_published(video_ids):
+        cache_versions.bump(cache_versions.SEARCH)
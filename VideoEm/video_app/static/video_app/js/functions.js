@@ -52,7 +52,7 @@ const createVideoElement = (video, action) => {
     link_to_video.target = '_self';
 
     const preview = document.createElement('video');
-    preview.src = `/proxy-video/?video_url=${encodeURIComponent(video.temp_link)}`;
+    preview.src = `/proxy/${encodeURIComponent(video.video_id)}/`;
     preview.setAttribute('muted', '');
     preview.setAttribute('preload', 'metadata');
     preview.setAttribute('webkit-playsinline', '');
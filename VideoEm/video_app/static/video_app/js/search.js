@@ -2,18 +2,23 @@
 const searchButton = document.getElementById('btn_search');
 const toTagButton = document.getElementById('btn_to_tag_search');
 const searchField = document.getElementById('search_field');
+const suggestionList = document.getElementById('search_suggestions');
 const action = 'watch';
+const suggestDelay = 150;
+const suggestMinLength = 2;
+let suggestTimeout;
+let suggestController;
 
-if (!searchButton || !toTagButton || !searchField) {
+if (!searchButton || !toTagButton || !searchField || !suggestionList) {
     console.error("Required DOM elements are missing");
 }
 
 searchButton.addEventListener('click', async () => {
     try {
-        let query = searchField.value.replace(/[^a-zA-Z0-9]/g, "").trim();
+        let query = searchField.value.trim();
 
         if (query !== "") {
-            let next = `/api/v1/search?q=${query}`;
+            let next = `/api/v1/search?q=${encodeURIComponent(query)}`;
             next = await loadMoreVideos(next, action);
             window.setNextUrl(next);
         }
@@ -24,4 +29,52 @@ searchButton.addEventListener('click', async () => {
 
 toTagButton.addEventListener('click', () => {
     window.location.href = "/tag_search/";
-});
\ No newline at end of file
+});
+
+/**
+ * Replacing the options of the suggestion datalist.
+ * @param {string[]} suggestions - tags and titles to offer
+ */
+const showSuggestions = (suggestions) => {
+    suggestionList.replaceChildren(...suggestions.map(suggestion => {
+        const option = document.createElement('option');
+        option.value = suggestion;
+        return option;
+    }));
+}
+
+/**
+ * Loading suggestions for the typed text, cancelling the request for the previous text.
+ * @param {string} query - text typed in the search field
+ */
+const loadSuggestions = async (query) => {
+    if (suggestController) {
+        suggestController.abort();
+    }
+    suggestController = new AbortController();
+
+    try {
+        const response = await fetch(`/api/v1/autocomplete?q=${encodeURIComponent(query)}`,
+                                     {signal: suggestController.signal});
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        showSuggestions([...new Set([...data.tags, ...data.titles])]);
+    } catch (error) {
+        if (error.name !== 'AbortError') {
+            console.error("Failed to load suggestions:", error);
+        }
+    }
+}
+
+searchField.addEventListener('input', () => {
+    clearTimeout(suggestTimeout);
+    const query = searchField.value.trim();
+
+    if (query.length < suggestMinLength) {
+        showSuggestions([]);
+        return;
+    }
+    suggestTimeout = setTimeout(() => loadSuggestions(query), suggestDelay);
+});
@@ -15,6 +15,8 @@ const tg_window = window.Telegram.WebApp;
 
 
 const url_update_video = `/api/v1/update_video/${video_id}`;
+const url_add_view = `/api/v1/view_add/${video_id}`;
+const url_add_history = '/api/v1/history_add';
 const url_subscription = '/api/v1/subscriptions';
 
 if (!button_subscribe || !button_like || !video_id || !csrf || !author_id) {
@@ -28,17 +30,13 @@ if (!button_subscribe || !button_like || !video_id || !csrf || !author_id) {
  * @param {string} url - API URL
  * @param {string} field - Field in the database to update
  * @param {string} csrf - Django CSRF token
- * @param {number} [telegram_id=null] - Optional: User Telegram ID to add the video to their viewing history
- * @param {string} [video_id=null] - Optional: ID of the video that was viewed
  */
-const updateVideo = async (url, field, csrf, telegram_id, video_id = null) => {
+const updateVideo = async (url, field, csrf) => {
 
     if (!url || !field || !csrf) {
 		throw new Error("Missing required parameters: url, field, or csrf");
 	}
 
-	const url_add_history = '/api/v1/history_add';
-
     try {
         const response_get_views = await fetch(url);
         if (!response_get_views.ok) {
@@ -59,34 +57,45 @@ const updateVideo = async (url, field, csrf, telegram_id, video_id = null) => {
 		if (!response_update.ok) {
 			throw new Error(`Failed to update video: ${response_update.statusText}`);
 		}
-
-        if (video_id) {
-            const response_add_history = await fetch(url_add_history, {
-				method: 'POST',
-				headers: {
-					'Content-Type': 'application/json',
-					'X-CSRFToken': csrf,
-				},
-				body: JSON.stringify({
-					user: telegram_id,
-					video: video_id,
-				}),
-			});
-
-			if (!response_add_history.ok) {
-				throw new Error(`Failed to add viewing history: ${response_add_history.statusText}`);
-			}
-        }
     } catch (error) {
         console.error('Error occurred:', error);
     }
 };
 
 /**
- * Increase views by one
+ * Increase views by one and add the video to the user's viewing history
 */
 const increaseViews = async () => {
-    await updateVideo(url_update_video, 'view_count', csrf, telegram_id, video_id);
+    try {
+        const response_add_view = await fetch(url_add_view, {
+			method: 'POST',
+			headers: {
+				'X-CSRFToken': csrf,
+			},
+		});
+
+		if (!response_add_view.ok) {
+			throw new Error(`Failed to count view: ${response_add_view.statusText}`);
+		}
+
+        const response_add_history = await fetch(url_add_history, {
+			method: 'POST',
+			headers: {
+				'Content-Type': 'application/json',
+				'X-CSRFToken': csrf,
+			},
+			body: JSON.stringify({
+				user: telegram_id,
+				video: video_id,
+			}),
+		});
+
+		if (!response_add_history.ok) {
+			throw new Error(`Failed to add viewing history: ${response_add_history.statusText}`);
+		}
+    } catch (error) {
+        console.error('Error occurred:', error);
+    }
 };
 
 /**
@@ -1,27 +1,174 @@
 import time
+from datetime import timedelta
 
-from celery import shared_task
+from celery import group, shared_task
+from video_app import history_partitions, popularity
+from video_app.history_stream import flush_history
+from video_app.view_counts import flush_views
 from video_app.models import Video
-from video_app.utils import renew_temp_links
-from django.core.paginator import Paginator
+from video_app.utils import TempLinkRenewer
+from video_app.video_cache import get_video_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, Min, Max
+from django.utils.timezone import now
+
+RENEWAL_RANGE_LOCK_KEY = 'update_links:range:{}'
+
+
+def expiring_links_filter():
+    """
+    Filter for videos whose temporary link expires within TEMP_LINK_RENEWAL_WINDOW or was never fetched.
+    """
+    deadline = now() + timedelta(seconds=settings.TEMP_LINK_RENEWAL_WINDOW)
+    return Q(temp_link_expires_at__lte=deadline) | Q(temp_link_expires_at__isnull=True)
+
+
+def iter_pk_ranges(range_size):
+    """
+    Yield half-open (lo, hi) primary key ranges covering the Video table.
+    Range bounds are aligned to range_size, so they stay the same between runs.
+    """
+    bounds = Video.objects.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return
+
+    start = bounds['lo'] // range_size * range_size
+    for lo in range(start, bounds['hi'] + 1, range_size):
+        yield lo, lo + range_size
 
 
 @shared_task
 def update_links():
     """
-    Fetch all videos from the database and renew their temporary links.
+    Split the Video table into primary key ranges and renew expiring links of every range
+    in parallel on the workers.
+    Every run dispatches every range: new links enter the expiry window on each run and
+    the expiry filter makes renewing a range again harmless.
     """
     try:
-        all_videos = Video.objects.all()
-        paginator = Paginator(all_videos, 100)
+        ranges = list(iter_pk_ranges(settings.TEMP_LINK_RENEWAL_RANGE_SIZE))
 
-        for page_number in paginator.page_range:
-            page = paginator.page(page_number)
-            renew_temp_links(page.object_list)
+        group(renew_links_range.s(lo, hi) for lo, hi in ranges).apply_async()
 
-        print(f"Update done {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}")
+        print(f"Update dispatched {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}: "
+              f"{len(ranges)} ranges")
 
     except Exception as e:
 
         print(f"Error updating links: {e}")
 
+
+@shared_task(acks_late=True)
+def renew_links_range(lo, hi):
+    """
+    Renew temporary links of videos with lo <= pk < hi which expire within TEMP_LINK_RENEWAL_WINDOW.
+    Links that are still fresh are skipped without any request to Telegram.
+    A range still being renewed by the previous run is skipped.
+    """
+    lock_key = RENEWAL_RANGE_LOCK_KEY.format(lo)
+    if not cache.add(lock_key, 1, settings.TEMP_LINK_RENEWAL_INTERVAL):
+        print(f"Range [{lo}, {hi}) is still being renewed, skipped")
+        return
+
+    try:
+        expiring_videos = (Video.objects
+                           .filter(pk__gte=lo, pk__lt=hi)
+                           .filter(expiring_links_filter())
+                           .only('video_id')
+                           .order_by())
+
+        with TempLinkRenewer() as renewer:
+            renewer.renew(expiring_videos)
+    finally:
+        cache.delete(lock_key)
+
+    print(f"Range [{lo}, {hi}) done: {renewer.report()}")
+
+
+@shared_task
+def warm_popular_links():
+    """
+    Renew expiring links of the TEMP_LINK_HOT_SET_SIZE most accessed videos, hottest first.
+    Links of other videos are renewed lazily when they are accessed.
+    """
+    try:
+        hot_ids = popularity.hottest(settings.TEMP_LINK_HOT_SET_SIZE)
+        rank = {video_id: position for position, video_id in enumerate(hot_ids)}
+
+        expiring_videos = (Video.objects
+                           .filter(video_id__in=hot_ids)
+                           .filter(expiring_links_filter())
+                           .only('video_id')
+                           .order_by())
+        expiring_videos = sorted(expiring_videos, key=lambda obj: rank[obj.video_id])
+
+        with TempLinkRenewer() as renewer:
+            renewer.renew(expiring_videos)
+
+        print(f"Warm up done {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}: "
+              f"{len(hot_ids)} hot videos, {renewer.report()}")
+
+    except Exception as e:
+
+        print(f"Error warming links: {e}")
+
+
+@shared_task
+def decay_video_heat():
+    """
+    Decay access scores so that the hot set follows recent popularity.
+    """
+    popularity.decay_heat(settings.VIDEO_HEAT_DECAY_FACTOR, settings.VIDEO_HEAT_MIN_SCORE)
+
+
+@shared_task
+def flush_view_counts():
+    """
+    Write views buffered in Redis to Video.view_count.
+    """
+    views, updated = flush_views(settings.VIEW_COUNT_FLUSH_BATCH_SIZE, settings.VIEW_COUNT_FLUSH_LOCK_TIMEOUT)
+    if views:
+        print(f"Flushed {views} views of {updated} videos")
+
+
+@shared_task
+def flush_watching_history():
+    """
+    Write watching history queued in Redis to the database.
+    """
+    written = flush_history(settings.HISTORY_FLUSH_MAX_BATCHES)
+    if written:
+        print(f"Flushed {written} watching history entries")
+
+
+@shared_task
+def trim_video_cache():
+    """
+    Evict least recently used segments of the proxy's video cache once it grows over VIDEO_CACHE_MAX_SIZE.
+    """
+    total = get_video_cache().trim()
+    print(f"Video cache holds {total} bytes")
+
+
+@shared_task
+def maintain_watching_history():
+    """
+    Create upcoming WatchingHistory partitions, roll up yesterday's views
+    and drop partitions older than HISTORY_RETENTION_MONTHS.
+    """
+    try:
+        if not history_partitions.is_partitioned():
+            print("WatchingHistory is not partitioned, skipping maintenance")
+            return
+
+        created = history_partitions.ensure_partitions(settings.HISTORY_PARTITIONS_AHEAD)
+        today = now().date()
+        rolled_up = history_partitions.rollup(today - timedelta(days=1), today)
+        dropped = history_partitions.drop_expired_partitions(settings.HISTORY_RETENTION_MONTHS)
+
+        print(f"History maintenance done: created {created}, rolled up {rolled_up} video days, dropped {dropped}")
+
+    except Exception as e:
+
+        print(f"Error maintaining watching history: {e}")
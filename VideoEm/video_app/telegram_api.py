@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import threading
+import time
+import weakref
+
+from email.utils import parsedate_to_datetime
+
+import httpx
+import requests
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('django')
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+API_URL = 'https://api.telegram.org'
+
+
+class TelegramAPIError(Exception):
+    """ Bot API answered with ok=false or with a malformed response """
+
+
+class TelegramUnavailable(TelegramAPIError):
+    """ Bot API is unreachable, the circuit is open or the rate limit budget is exhausted """
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after `threshold` consecutive failures.
+    After `reset_timeout` seconds one trial call is let through, its result closes or reopens the circuit.
+    State is kept per process.
+    """
+
+    def __init__(self, threshold, reset_timeout):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # half-open: let one call through and push the next trial further
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Telegram API circuit opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Token bucket kept in Redis, so the budget is shared by all web and Celery processes.
+    Refills `rate` tokens per second up to `burst`.
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, key, rate, burst):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self._script = None
+
+    def _take(self):
+        """
+        Try to take one token. Return 0 on success or the seconds until the next token is available.
+        Fails open when Redis is unavailable.
+        """
+        try:
+            if self._script is None:
+                self._script = get_redis_connection('default').register_script(self.SCRIPT)
+            return float(self._script(keys=[self.key], args=[self.rate, self.burst]))
+        except RedisError as e:
+            logger.warning(f"Telegram API rate limiter unavailable: {e}")
+            return 0
+
+    def acquire(self, timeout):
+        """
+        Take one token, waiting up to timeout seconds for it. Return False if it did not arrive in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def aacquire(self, timeout):
+        """
+        Async version of acquire().
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = await sync_to_async(self._take, thread_sensitive=False)()
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+class BaseTelegramBotAPI:
+    """
+    Settings, circuit breaker, rate limiter and response handling shared by the sync and async clients.
+    """
+
+    def __init__(self, token, breaker, limiter):
+        self.token = token
+        self.timeout = settings.TELEGRAM_API_TIMEOUT
+        self.retries = settings.TELEGRAM_API_RETRIES
+        self.backoff = settings.TELEGRAM_API_BACKOFF
+        self.max_retry_after = settings.TELEGRAM_API_MAX_RETRY_AFTER
+        self.rate_wait = settings.TELEGRAM_API_RATE_WAIT
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def method_url(self, method):
+        return f'{API_URL}/bot{self.token}/{method}'
+
+    def file_url(self, file_path):
+        return f'{API_URL}/file/bot{self.token}/{file_path}'
+
+    def _backoff_delay(self, attempt):
+        return self.backoff * 2 ** attempt * (1 + random.random())
+
+    def _retry_after(self, response, attempt):
+        """
+        Seconds to wait given by a 429 answer: retry_after of the body, else the Retry-After header
+        in seconds or as an HTTP date, else the backoff delay of the attempt.
+        """
+        try:
+            return int(response.json()['parameters']['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            pass
+
+        header = response.headers.get('Retry-After', '').strip()
+        try:
+            return max(int(header), 0)
+        except ValueError:
+            pass
+        try:
+            return max(math.ceil(parsedate_to_datetime(header).timestamp() - time.time()), 0)
+        except (ValueError, TypeError, OverflowError):
+            return math.ceil(self._backoff_delay(attempt))
+
+    def _check_throttled(self, method, response, attempt):
+        """
+        Return seconds to wait before retrying a 429 answer, raise if it should not be retried.
+        """
+        retry_after = self._retry_after(response, attempt)
+        if retry_after > self.max_retry_after or attempt == self.retries:
+            raise TelegramUnavailable(f"{method}: too many requests, retry after {retry_after}s")
+        return retry_after
+
+    def _result(self, method, response):
+        """
+        Return the result of a non-5xx answer or raise TelegramAPIError.
+        """
+        self.breaker.record_success()
+        try:
+            data = response.json()
+        except ValueError:
+            raise TelegramAPIError(f"{method}: malformed response")
+        if not data.get('ok', False):
+            raise TelegramAPIError(f"{method}: {data.get('description', 'request failed')}")
+        return data.get('result')
+
+    def _check_allowed(self, method):
+        if not self.breaker.allow():
+            raise TelegramUnavailable(f"{method}: circuit is open")
+
+
+class TelegramBotAPI(BaseTelegramBotAPI):
+    """
+    Client for the Telegram Bot API shared by web views and Celery tasks.
+    Uses one pooled keep-alive session with connect and read timeouts, retries 429 and 5xx answers
+    with exponential backoff, fails fast while the circuit is open and spends a rate limit budget
+    shared across processes.
+    """
+
+    def __init__(self, token, breaker, limiter):
+        super().__init__(token, breaker, limiter)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=settings.TELEGRAM_API_POOL_SIZE)
+        self.session.mount('https://', adapter)
+
+    def call(self, method, **params):
+        """
+        Call a Bot API method and return its result.
+        Raises TelegramAPIError if Telegram rejects the call and TelegramUnavailable if it can not be made.
+        """
+        error = None
+
+        for attempt in range(self.retries + 1):
+            self._check_allowed(method)
+            if not self.limiter.acquire(self.rate_wait):
+                raise TelegramUnavailable(f"{method}: rate limit budget exhausted")
+
+            try:
+                response = self.session.post(self.method_url(method), json=params, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                error = e
+            else:
+                if response.status_code == 429:
+                    time.sleep(self._check_throttled(method, response, attempt))
+                    continue
+                if response.status_code < 500:
+                    return self._result(method, response)
+                self.breaker.record_failure()
+                error = f"HTTP {response.status_code}"
+
+            if attempt < self.retries:
+                time.sleep(self._backoff_delay(attempt))
+
+        raise TelegramUnavailable(f"{method}: {error}")
+
+    def get_file_url(self, file_id):
+        """
+        Resolve file_id to a temporary download link, valid for at least one hour.
+        """
+        file_path = (self.call('getFile', file_id=file_id) or {}).get('file_path')
+        return self.file_url(file_path) if file_path else None
+
+    def open_file(self, url, headers=None, method='GET'):
+        """
+        Open a streamed download of a file link over the pooled session.
+        The caller must close the returned response.
+        """
+        return self.session.request(method, url, headers=headers, stream=True, timeout=self.timeout)
+
+
+class AsyncTelegramBotAPI(BaseTelegramBotAPI):
+    """
+    Async counterpart of TelegramBotAPI for async views, built on a pooled httpx.AsyncClient.
+    Shares the circuit breaker with the sync client of the same process.
+    """
+
+    def __init__(self, token, breaker, limiter):
+        super().__init__(token, breaker, limiter)
+        connect_timeout, read_timeout = self.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=settings.TELEGRAM_API_ASYNC_POOL_SIZE,
+                                max_keepalive_connections=settings.TELEGRAM_API_ASYNC_POOL_SIZE),
+        )
+
+    async def call(self, method, **params):
+        """
+        Call a Bot API method and return its result, see TelegramBotAPI.call().
+        """
+        error = None
+
+        for attempt in range(self.retries + 1):
+            self._check_allowed(method)
+            if not await self.limiter.aacquire(self.rate_wait):
+                raise TelegramUnavailable(f"{method}: rate limit budget exhausted")
+
+            try:
+                response = await self.client.post(self.method_url(method), json=params)
+            except httpx.HTTPError as e:
+                self.breaker.record_failure()
+                error = e
+            else:
+                if response.status_code == 429:
+                    await asyncio.sleep(self._check_throttled(method, response, attempt))
+                    continue
+                if response.status_code < 500:
+                    return self._result(method, response)
+                self.breaker.record_failure()
+                error = f"HTTP {response.status_code}"
+
+            if attempt < self.retries:
+                await asyncio.sleep(self._backoff_delay(attempt))
+
+        raise TelegramUnavailable(f"{method}: {error}")
+
+    async def get_file_url(self, file_id):
+        file_path = (await self.call('getFile', file_id=file_id) or {}).get('file_path')
+        return self.file_url(file_path) if file_path else None
+
+    async def open_file(self, url, headers=None, method='GET'):
+        """
+        Open a streamed download of a file link. The caller must aclose() the returned response.
+        """
+        request = self.client.build_request(method, url, headers=headers)
+        return await self.client.send(request, stream=True)
+
+
+_breaker = None
+_client = None
+_async_clients = weakref.WeakKeyDictionary()
+_client_lock = threading.Lock()
+
+
+def _get_breaker():
+    global _breaker
+    if _breaker is None:
+        _breaker = CircuitBreaker(settings.TELEGRAM_API_CIRCUIT_THRESHOLD, settings.TELEGRAM_API_CIRCUIT_RESET)
+    return _breaker
+
+
+def _get_limiter():
+    return RateLimiter('telegram_api:bucket', settings.TELEGRAM_API_RATE, settings.TELEGRAM_API_BURST)
+
+
+def get_client():
+    """
+    Return the process wide TelegramBotAPI client.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramBotAPI(BOT_TOKEN, _get_breaker(), _get_limiter())
+    return _client
+
+
+def get_async_client():
+    """
+    Return the AsyncTelegramBotAPI client of the running event loop.
+    Pooled httpx connections belong to the loop that opened them, so every loop gets its own
+    client, dropped along with the loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = AsyncTelegramBotAPI(BOT_TOKEN, _get_breaker(), _get_limiter())
+    return client
@@ -0,0 +1,330 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger('django')
+
+INVALIDATION_CHANNEL = 'two_tier_cache:invalidate'
+CLEAR_ALL = '*'
+
+
+class LocalTier:
+    """
+    Bounded in-process LRU of encoded cache values with a per-entry deadline.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'l1_hits': 0, 'l1_misses': 0, 'redis_hits': 0, 'redis_misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            deadline, value = entry
+            if deadline <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ProcessTiers:
+    """
+    Local tiers of one process, one per Redis server and key prefix, and one invalidation
+    listener per Redis server feeding all of its tiers.
+    Django instantiates cache backends per thread and async context, so their local state lives here.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self._tiers = {}
+        self._listening = set()
+        self._lock = threading.Lock()
+
+    def tier(self, server, key_prefix, max_entries):
+        with self._lock:
+            if (server, key_prefix) not in self._tiers:
+                self._tiers[server, key_prefix] = LocalTier(max_entries)
+            return self._tiers[server, key_prefix]
+
+    def _tiers_of(self, server):
+        with self._lock:
+            return [tier for (tier_server, _), tier in self._tiers.items() if tier_server == server]
+
+    def ensure_listener(self, server, get_client):
+        """
+        Start the invalidation listener of a Redis server, get_client() returns a connection to it.
+        """
+        if server in self._listening:
+            return
+        with self._lock:
+            if server in self._listening:
+                return
+            thread = threading.Thread(target=self._listen, args=(server, get_client),
+                                      name='two-tier-cache-invalidation', daemon=True)
+            thread.start()
+            self._listening.add(server)
+
+    def _listen(self, server, get_client):
+        backoff = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                backoff = 1
+                for message in pubsub.listen():
+                    if message.get('type') != 'message':
+                        continue
+                    keys = json.loads(message['data'])
+                    for tier in self._tiers_of(server):
+                        if keys == CLEAR_ALL:
+                            tier.clear()
+                        else:
+                            tier.delete(keys)
+            except Exception as e:
+                # messages may have been missed, nothing local can be trusted
+                for tier in self._tiers_of(server):
+                    tier.clear()
+                logger.warning(f"Cache invalidation listener failed, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+_process_tiers = None
+_process_tiers_lock = threading.Lock()
+
+
+def process_tiers():
+    """
+    ProcessTiers of the current process, created anew after a fork.
+    """
+    global _process_tiers
+    pid = os.getpid()
+    if _process_tiers is None or _process_tiers.pid != pid:
+        with _process_tiers_lock:
+            if _process_tiers is None or _process_tiers.pid != pid:
+                _process_tiers = ProcessTiers(pid)
+    return _process_tiers
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    django-redis backend with an in-process LRU in front of Redis.
+
+    Reads are served from the local tier for at most L1_TIMEOUT seconds. Values are kept there
+    encoded, so callers never share mutable objects. Every write or delete through this backend
+    is published on a Redis channel and each process drops the affected keys from its local tier;
+    if the subscription breaks the local tier is cleared, L1_TIMEOUT bounds staleness either way.
+    The local tier and the subscription belong to the process (see ProcessTiers), the instances
+    Django creates in every thread share them.
+
+    OPTIONS: L1_MAX_ENTRIES (default 10000) and L1_TIMEOUT in seconds (default 5), the rest is
+    passed to django-redis.
+    """
+
+    def __init__(self, server, params):
+        params = dict(params)
+        options = dict(params.get('OPTIONS', {}))
+        max_entries = options.pop('L1_MAX_ENTRIES', 10000)
+        self.l1_timeout = options.pop('L1_TIMEOUT', 5)
+        params['OPTIONS'] = options
+        super().__init__(server, params)
+
+        self._server = server
+        self._max_entries = max_entries
+        self._local = None
+        self._pid = None
+
+    # local tier
+
+    def _key(self, key, version=None):
+        return str(self.client.make_key(key, version=version))
+
+    def _count(self, stat, n=1):
+        self._local.count(stat, n)
+
+    def _remember(self, full_key, value):
+        self._local.set(full_key, self.client.encode(value), self.l1_timeout)
+
+    def _recall(self, full_key):
+        encoded = self._local.get(full_key)
+        if encoded is None:
+            return None
+        return self.client.decode(encoded)
+
+    def _invalidate(self, full_keys):
+        self._attach()
+        self._local.delete(full_keys)
+        try:
+            self.client.get_client(write=True).publish(INVALIDATION_CHANNEL, json.dumps(full_keys))
+        except RedisError as e:
+            logger.warning(f"Failed to publish cache invalidation: {e}")
+
+    def _attach(self):
+        """
+        Attach to the local tier of this process and make sure the process listens for
+        invalidations, again after a fork.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        tiers = process_tiers()
+        self._local = tiers.tier(self._server, self.key_prefix, self._max_entries)
+        tiers.ensure_listener(self._server, lambda: self.client.get_client(write=False))
+        self._pid = pid
+
+    def stats(self):
+        """
+        Hit and miss counts of both tiers in this process since it started.
+        """
+        self._attach()
+        stats = self._local.stats()
+        l1_total = stats['l1_hits'] + stats['l1_misses']
+        redis_total = stats['redis_hits'] + stats['redis_misses']
+        stats['l1_hit_ratio'] = stats['l1_hits'] / l1_total if l1_total else 0.0
+        stats['redis_hit_ratio'] = stats['redis_hits'] / redis_total if redis_total else 0.0
+        stats['l1_entries'] = len(self._local)
+        stats['pid'] = os.getpid()
+        return stats
+
+    # reads
+
+    def get(self, key, default=None, version=None, client=None):
+        self._attach()
+        full_key = self._key(key, version)
+        value = self._recall(full_key)
+        if value is not None:
+            self._count('l1_hits')
+            return value
+
+        self._count('l1_misses')
+        value = super().get(key, default=None, version=version, client=client)
+        if value is None:
+            self._count('redis_misses')
+            return default
+
+        self._count('redis_hits')
+        self._remember(full_key, value)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        self._attach()
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._recall(self._key(key, version))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        self._count('l1_hits', len(found))
+        self._count('l1_misses', len(missing))
+        if missing:
+            fetched = super().get_many(missing, version=version, client=client)
+            self._count('redis_hits', len(fetched))
+            self._count('redis_misses', len(missing) - len(fetched))
+            for key, value in fetched.items():
+                self._remember(self._key(key, version), value)
+            found.update(fetched)
+        return found
+
+    # writes
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        result = super().set(key, value, timeout, version=version, client=client, nx=nx, xx=xx)
+        self._invalidate([self._key(key, version)])
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().add(key, value, timeout, version=version, client=client)
+        if result:
+            self._invalidate([self._key(key, version)])
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().set_many(data, timeout, version=version, client=client)
+        self._invalidate([self._key(key, version) for key in data])
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        self._invalidate([self._key(key, version)])
+        return result
+
+    def delete_many(self, keys, version=None, client=None):
+        keys = list(keys)
+        result = super().delete_many(keys, version=version, client=client)
+        self._invalidate([self._key(key, version) for key in keys])
+        return result
+
+    def incr(self, key, delta=1, version=None, client=None, ignore_key_check=False):
+        result = super().incr(key, delta, version=version, client=client, ignore_key_check=ignore_key_check)
+        self._invalidate([self._key(key, version)])
+        return result
+
+    def decr(self, key, delta=1, version=None, client=None):
+        result = super().decr(key, delta, version=version, client=client)
+        self._invalidate([self._key(key, version)])
+        return result
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        result = super().touch(key, timeout, version=version, client=client)
+        self._invalidate([self._key(key, version)])
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._attach()
+        self._local.clear()
+        try:
+            self.client.get_client(write=True).publish(INVALIDATION_CHANNEL, json.dumps(CLEAR_ALL))
+        except RedisError as e:
+            logger.warning(f"Failed to publish cache invalidation: {e}")
+        return result
@@ -1,74 +1,114 @@
-import requests
-import os
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.db.models import QuerySet
+from django.utils.timezone import now
 from contextlib import contextmanager
-from django.db import connection
+from django.db import connection, transaction
 
+from .telegram_api import get_client, TelegramAPIError
 
 
-BOT_TOKEN = os.environ.get('BOT_TOKEN')
-
 def get_new_temp_link(video_id):
     """
     Fetch a new temporary link for a video from the Telegram API.
     Temporary link is valid for at least one hour.
     """
-    get_link_url = f'https://api.telegram.org/bot{BOT_TOKEN}/getFile?file_id={video_id}'
-
     try:
-        response = requests.get(get_link_url)
-        response.raise_for_status()
-
-        if response.json().get('ok', False):
-            file_path = response.json()['result'].get('file_path')
-            if file_path:
-                return f'https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}'
-        return None
-
-    except requests.exceptions.RequestException as e:
+        return get_client().get_file_url(video_id)
+    except TelegramAPIError:
         return None
 
 
-def renew_temp_links(video_queryset: QuerySet):
-    """
-    Get new temporary links for all videos in the provided QuerySet.
+class TempLinkRenewer:
     """
-    updated_objects = []
-    if not video_queryset.exists():
-        return video_queryset
+    Renews temporary links concurrently.
+    getFile requests run in a bounded thread pool over the shared Telegram API client, results
+    are written back with bulk_update once per batch.
 
-    for obj in video_queryset:
-        is_temp_link_invalid = True
-        if obj.temp_link:
-            try:
-                response = requests.head(obj.temp_link)
-                is_temp_link_invalid = False
-            except requests.exceptions.RequestException:
-                is_temp_link_invalid = True
-
-        if is_temp_link_invalid or (not is_temp_link_invalid and response.status_code == 404):
-
-            temp_link = get_new_temp_link(obj.video_id)
+    with TempLinkRenewer() as renewer:
+        renewer.renew(videos)
+    print(renewer.report())
+    """
 
+    def __init__(self, concurrency=None, batch_size=None):
+        self.concurrency = concurrency or settings.TEMP_LINK_RENEWAL_CONCURRENCY
+        self.batch_size = batch_size or settings.TEMP_LINK_RENEWAL_BATCH_SIZE
+        self.checked = 0
+        self.renewed = 0
+        self.failed = 0
+        self._started = None
+        self._executor = None
+
+    def __enter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='temp-link')
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._executor.shutdown(wait=True)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._started if self._started else 0.0
+
+    def report(self):
+        elapsed = self.elapsed
+        rate = self.checked / elapsed if elapsed else 0.0
+        return (f"checked {self.checked}, renewed {self.renewed}, failed {self.failed} "
+                f"in {elapsed:.1f}s ({rate:.1f} links/s)")
+
+    def _fetch(self, obj):
+        return get_new_temp_link(obj.video_id)
+
+    def _renew_batch(self, batch):
+        updated_objects = []
+        fetched_at = now()
+        for obj, temp_link in zip(batch, self._executor.map(self._fetch, batch)):
+            self.checked += 1
             if temp_link:
-                obj.temp_link = temp_link
+                obj.set_temp_link(temp_link, fetched_at=fetched_at)
                 updated_objects.append(obj)
+            else:
+                self.failed += 1
+
+        if updated_objects:
+            model = type(updated_objects[0])
+            model.objects.bulk_update(updated_objects, model.TEMP_LINK_FIELDS)
+            self.renewed += len(updated_objects)
+
+    def renew(self, videos):
+        """
+        Renew temporary links for an iterable of videos.
+        """
+        batch = []
+        for obj in videos:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                self._renew_batch(batch)
+                batch = []
+        if batch:
+            self._renew_batch(batch)
+        return self
 
-    if updated_objects:
-        video_queryset.model.objects.bulk_update(updated_objects, ['temp_link'])
 
-    return video_queryset
+def renew_temp_links(video_queryset: QuerySet):
+    """
+    Get new temporary links for all videos in the provided QuerySet.
+    """
+    with TempLinkRenewer() as renewer:
+        renewer.renew(video_queryset)
+    return renewer
 
 
 @contextmanager
-def higher_work_mem():
+def statement_timeout(milliseconds):
     """
-    Context manager that temporarily increases work_mem for PostgreSQL queries.
+    Context manager that runs its queries in a transaction whose statements PostgreSQL
+    cancels after the given number of milliseconds, raising OperationalError.
+    0 disables the timeout, for maintenance statements outlasting the connection's default one.
     """
-    with connection.cursor() as cursor:
-        cursor.execute("SET LOCAL work_mem = '64MB';")
-        try:
-            yield
-        finally:
-            cursor.execute("RESET work_mem;")
\ No newline at end of file
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"SET LOCAL statement_timeout = {int(milliseconds)};")
+        yield
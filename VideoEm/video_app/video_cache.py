@@ -0,0 +1,418 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
+
+from .file_links import resolve_link, aresolve_link
+from .telegram_api import get_client, get_async_client
+
+logger = logging.getLogger('django')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, total):
+    """
+    Resolve a single 'bytes=' Range header against the file size.
+    Return (start, end) with inclusive end, None if there is no usable header, which includes
+    invalid ranges like 'bytes=100-50' (RFC 9110 says to ignore them and serve the whole file),
+    and False if the range can not be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if first and last and int(last) < int(first):
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), total - 1) if last else total - 1
+    else:
+        start = max(total - int(last), 0)
+        end = total - 1
+
+    if start >= total or start > end:
+        return False
+    return start, end
+
+
+class SegmentCache:
+    """
+    On-disk cache of video bytes keyed by video_id and fixed-size segment.
+    Segments are stored as <root>/<key[:2]>/<key>/<index>.seg next to a 'size' file holding the
+    length of the whole video, so entries survive Telegram rotating the temporary URL.
+    Every hit refreshes the segment's mtime, trim(), run periodically by the trim_video_cache task,
+    evicts least recently used segments once the cache grows over max_size.
+    """
+
+    def __init__(self, root, max_size, segment_size):
+        self.root = str(root)
+        self.max_size = max_size
+        self.segment_size = segment_size
+
+    def _dir(self, video_id):
+        key = hashlib.sha1(video_id.encode()).hexdigest()
+        return os.path.join(self.root, key[:2], key)
+
+    def segment_path(self, video_id, index):
+        return os.path.join(self._dir(video_id), f'{index}.seg')
+
+    def segment_bounds(self, index, total):
+        """
+        Inclusive byte bounds of segment index in a video of total bytes.
+        """
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, total) - 1
+
+    def get_size(self, video_id):
+        try:
+            with open(os.path.join(self._dir(video_id), 'size')) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set_size(self, video_id, total):
+        self._write_atomic(os.path.join(self._dir(video_id), 'size'), str(total).encode())
+
+    def get_segment(self, video_id, index):
+        """
+        Return the path of a cached segment and mark it as recently used, or None on a miss.
+        """
+        path = self.segment_path(video_id, index)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    @contextmanager
+    def segment_lock(self, video_id, index):
+        """
+        Exclusive lock on one segment, held across threads and processes while it is being fetched.
+        """
+        path = os.path.join(self._dir(video_id), f'{index}.lock')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @asynccontextmanager
+    async def asegment_lock(self, video_id, index, poll_interval=0.05):
+        """
+        Async version of segment_lock(), polls the lock instead of blocking the event loop.
+        """
+        path = os.path.join(self._dir(video_id), f'{index}.lock')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(poll_interval)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def put_segment(self, video_id, index, data):
+        self._write_atomic(self.segment_path(video_id, index), data)
+
+    def read(self, path, start, end, chunk_size):
+        """
+        Yield bytes start..end (inclusive, relative to the segment) of a cached segment.
+        """
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    def read_bytes(self, path, start, end):
+        """
+        Return bytes start..end (inclusive, relative to the segment) of a cached segment.
+        """
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def _write_atomic(self, path, data):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def trim(self):
+        """
+        Evict least recently used segments until the cache takes at most 90% of max_size.
+        The size file of a video goes with its last segment. Lock files and directories stay:
+        a fetch may hold the lock or be about to write into the directory, and unlinking a held
+        lock would let a second fetcher lock a new file.
+        """
+        segments = []
+        counts = {}
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not name.endswith('.seg'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                segments.append((stat.st_mtime, stat.st_size, path))
+                counts[dirpath] = counts.get(dirpath, 0) + 1
+                total += stat.st_size
+
+        if total <= self.max_size:
+            return total
+
+        target = self.max_size * 9 // 10
+        segments.sort()
+        for _, size, path in segments:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            directory = os.path.dirname(path)
+            counts[directory] -= 1
+            if counts[directory] == 0:
+                try:
+                    os.remove(os.path.join(directory, 'size'))
+                except OSError:
+                    pass
+        logger.info(f"Video cache trimmed to {total} bytes")
+        return total
+
+
+class UpstreamError(Exception):
+    """ Telegram did not return the requested bytes """
+
+
+class VideoLink:
+    """
+    Download link of one video, resolved on the first segment fetch and renewed once
+    if Telegram rejects it. Fully cached videos never resolve their link.
+    """
+
+    # statuses Telegram answers with for an expired or unknown file path
+    REJECTED = (403, 404)
+
+    def __init__(self, video_id):
+        self.video_id = video_id
+        self._url = None
+
+    def get(self, refresh=False):
+        if self._url is None or refresh:
+            self._url = resolve_link(self.video_id, refresh=refresh)
+        if not self._url:
+            raise UpstreamError("no download link for this video")
+        return self._url
+
+    async def aget(self, refresh=False):
+        if self._url is None or refresh:
+            self._url = await aresolve_link(self.video_id, refresh=refresh)
+        if not self._url:
+            raise UpstreamError("no download link for this video")
+        return self._url
+
+
+def store_segment(video_cache, video_id, index, status_code, headers, content):
+    """
+    Store the upstream answer to a segment request.
+    Return the segment bytes and the size of the whole video.
+    """
+    try:
+        if status_code == 206:
+            total = int(headers['Content-Range'].rsplit('/', 1)[1])
+            video_cache.set_size(video_id, total)
+            video_cache.put_segment(video_id, index, content)
+            return content, total
+        if status_code == 200:
+            # upstream ignored the range and sent the whole file, keep every segment of it
+            total = len(content)
+            video_cache.set_size(video_id, total)
+            for offset in range(0, total, video_cache.segment_size):
+                video_cache.put_segment(video_id, offset // video_cache.segment_size,
+                                        content[offset:offset + video_cache.segment_size])
+            start = index * video_cache.segment_size
+            return content[start:start + video_cache.segment_size], total
+    except (KeyError, ValueError) as e:
+        raise UpstreamError(f"malformed upstream response: {e}")
+    raise UpstreamError(f"upstream returned {status_code}")
+
+
+def segment_range_header(video_cache, index):
+    start = index * video_cache.segment_size
+    return {'Range': f'bytes={start}-{start + video_cache.segment_size - 1}'}
+
+
+def fetch_segment(video_cache, link, index):
+    """
+    Download one segment of a video into the cache.
+    Return the segment bytes and the size of the whole video.
+    """
+    headers = segment_range_header(video_cache, index)
+    upstream = get_client().open_file(link.get(), headers=headers)
+    if upstream.status_code in VideoLink.REJECTED:
+        upstream.close()
+        upstream = get_client().open_file(link.get(refresh=True), headers=headers)
+    try:
+        content = upstream.content if upstream.status_code in (200, 206) else b''
+    finally:
+        upstream.close()
+    return store_segment(video_cache, link.video_id, index, upstream.status_code, upstream.headers, content)
+
+
+async def afetch_segment(video_cache, link, index):
+    """
+    Async version of fetch_segment(), downloads with the async Telegram client.
+    """
+    headers = segment_range_header(video_cache, index)
+    upstream = await get_async_client().open_file(await link.aget(), headers=headers)
+    if upstream.status_code in VideoLink.REJECTED:
+        await upstream.aclose()
+        upstream = await get_async_client().open_file(await link.aget(refresh=True), headers=headers)
+    try:
+        content = await upstream.aread() if upstream.status_code in (200, 206) else b''
+    finally:
+        await upstream.aclose()
+    return await asyncio.to_thread(store_segment, video_cache, link.video_id, index, upstream.status_code,
+                                   upstream.headers, content)
+
+
+def load_segment(video_cache, link, index):
+    """
+    Return (path, None) for a cached segment or (None, data) for a segment fetched from Telegram.
+    Fetches are single-flight: concurrent requests for the same segment, from any thread or process,
+    wait for the first one and then read the bytes it stored instead of downloading them again.
+    """
+    path = video_cache.get_segment(link.video_id, index)
+    if path is not None:
+        return path, None
+
+    with video_cache.segment_lock(link.video_id, index):
+        path = video_cache.get_segment(link.video_id, index)
+        if path is not None:
+            return path, None
+        data, _ = fetch_segment(video_cache, link, index)
+        return None, data
+
+
+def load_size(video_cache, link):
+    """
+    Return the size of a video, fetching its first segment if it is not known yet.
+    """
+    total = video_cache.get_size(link.video_id)
+    if total is None:
+        load_segment(video_cache, link, 0)
+        total = video_cache.get_size(link.video_id)
+    if total is None:
+        raise UpstreamError("video size is unknown")
+    return total
+
+
+async def aload_segment(video_cache, link, index):
+    """
+    Async version of load_segment().
+    """
+    path = video_cache.get_segment(link.video_id, index)
+    if path is not None:
+        return path, None
+
+    async with video_cache.asegment_lock(link.video_id, index):
+        path = video_cache.get_segment(link.video_id, index)
+        if path is not None:
+            return path, None
+        data, _ = await afetch_segment(video_cache, link, index)
+        return None, data
+
+
+async def aload_size(video_cache, link):
+    """
+    Async version of load_size().
+    """
+    total = video_cache.get_size(link.video_id)
+    if total is None:
+        await aload_segment(video_cache, link, 0)
+        total = video_cache.get_size(link.video_id)
+    if total is None:
+        raise UpstreamError("video size is unknown")
+    return total
+
+
+def iter_range(video_cache, link, start, end, total, chunk_size):
+    """
+    Yield bytes start..end (inclusive) of a video, from disk where cached and from Telegram otherwise.
+    """
+    for index in range(start // video_cache.segment_size, end // video_cache.segment_size + 1):
+        segment_start, segment_end = video_cache.segment_bounds(index, total)
+        first = max(start, segment_start) - segment_start
+        last = min(end, segment_end) - segment_start
+
+        path, data = load_segment(video_cache, link, index)
+        if path is not None:
+            yield from video_cache.read(path, first, last, chunk_size)
+            continue
+
+        for offset in range(first, last + 1, chunk_size):
+            yield data[offset:min(offset + chunk_size, last + 1)]
+
+
+async def aiter_range(video_cache, link, start, end, total, chunk_size):
+    """
+    Async version of iter_range(). Disk reads run in worker threads, downloads on the event loop.
+    """
+    for index in range(start // video_cache.segment_size, end // video_cache.segment_size + 1):
+        segment_start, segment_end = video_cache.segment_bounds(index, total)
+        first = max(start, segment_start) - segment_start
+        last = min(end, segment_end) - segment_start
+
+        path, data = await aload_segment(video_cache, link, index)
+        if path is not None:
+            data = await asyncio.to_thread(video_cache.read_bytes, path, first, last)
+            first, last = 0, len(data) - 1
+
+        for offset in range(first, last + 1, chunk_size):
+            yield data[offset:min(offset + chunk_size, last + 1)]
+
+
+_cache = None
+
+
+def get_video_cache():
+    """
+    Return the process wide SegmentCache configured in settings.
+    """
+    global _cache
+    if _cache is None:
+        _cache = SegmentCache(settings.VIDEO_CACHE_DIR, settings.VIDEO_CACHE_MAX_SIZE,
+                              settings.VIDEO_CACHE_SEGMENT_SIZE)
+    return _cache
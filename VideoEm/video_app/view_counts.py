@@ -0,0 +1,112 @@
+import hashlib
+import uuid
+
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils.timezone import now
+from django_redis import get_redis_connection
+from redis.exceptions import LockError, ResponseError
+
+from .models import AppliedViewBatch, TelegramUser, Video
+
+PENDING_KEY = 'video_views:pending'
+FLUSHING_KEY = 'video_views:flushing'
+FLUSH_LOCK_KEY = 'video_views:flush_lock'
+FLUSH_ID_KEY = 'video_views:flush_id'
+
+
+def record_view(video_id):
+    """
+    Count one view of a video. The view is buffered in a Redis hash and written to
+    Video.view_count by flush_views().
+    """
+    get_redis_connection('default').hincrby(PENDING_KEY, video_id, 1)
+
+
+def _batch_digest(batch):
+    return hashlib.blake2b(','.join(batch).encode(), digest_size=16).hexdigest()
+
+
+def _apply(redis, flush_id, counts, batch_size):
+    """
+    Add buffered views to view_count of the videos and to total_views of their uploaders,
+    one UPDATE per table and batch_size videos, in video_id order.
+    Every batch is recorded as an AppliedViewBatch in its own transaction and then removed from
+    the flushing hash. If the flush dies in between, the retry finds the same batch first in the
+    hash and skips it, so views are counted exactly once.
+    """
+    items = sorted(counts.items())
+    updated = 0
+    for i in range(0, len(items), batch_size):
+        batch = dict(items[i:i + batch_size])
+        uploaders = Video.objects.filter(video_id__in=batch).values_list('video_id', 'user_id')
+
+        user_views = {}
+        for video_id, user_id in uploaders:
+            user_views[user_id] = user_views.get(user_id, 0) + batch[video_id]
+
+        with transaction.atomic():
+            _, created = AppliedViewBatch.objects.get_or_create(flush_id=flush_id, batch=_batch_digest(batch))
+            if created:
+                updated += (Video.objects
+                            .filter(video_id__in=batch)
+                            .update(view_count=_increments('video_id', 'view_count', batch)))
+                TelegramUser.objects.filter(telegram_id__in=user_views).update(
+                    total_views=_increments('telegram_id', 'total_views', user_views))
+        redis.hdel(FLUSHING_KEY, *batch)
+    return updated
+
+
+def _increments(key, field, deltas):
+    """
+    CASE expression adding deltas[key] to field of every row.
+    """
+    return Case(*(When(**{key: value}, then=F(field) + delta) for value, delta in deltas.items()),
+                default=F(field))
+
+
+def flush_views(batch_size, lock_timeout):
+    """
+    Move buffered views into the database. Return the number of views and of updated videos.
+    The pending hash is renamed before it is read, so views recorded during the flush go
+    to a new hash. A batch left over by a failed flush is applied before the next one is taken,
+    under the same flush id, see _apply().
+    Flushes hold a lock for up to lock_timeout seconds, an overlapping flush does nothing.
+    """
+    redis = get_redis_connection('default')
+    views = 0
+    updated = 0
+
+    lock = redis.lock(FLUSH_LOCK_KEY, timeout=lock_timeout, blocking=False)
+    if not lock.acquire():
+        return views, updated
+
+    try:
+        if not redis.exists(FLUSHING_KEY):
+            # the id is stored first, so a flushing hash always has the id it is applied under
+            redis.set(FLUSH_ID_KEY, uuid.uuid4().hex)
+            try:
+                redis.rename(PENDING_KEY, FLUSHING_KEY)
+            except ResponseError:
+                # nothing was viewed since the last flush
+                return views, updated
+        else:
+            # an evicted id starts a new one, only batches committed under the old id could be counted twice
+            redis.set(FLUSH_ID_KEY, uuid.uuid4().hex, nx=True)
+        flush_id = uuid.UUID(redis.get(FLUSH_ID_KEY).decode())
+
+        counts = {video_id.decode(): int(delta) for video_id, delta in redis.hgetall(FLUSHING_KEY).items()}
+        if counts:
+            updated = _apply(redis, flush_id, counts, batch_size)
+            views = sum(counts.values())
+        redis.delete(FLUSHING_KEY)
+        # every flush up to this one is finished, their records are no longer needed
+        AppliedViewBatch.objects.filter(applied_at__lte=now()).delete()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # the flush outlived the lock, another one may already hold it
+            pass
+
+    return views, updated
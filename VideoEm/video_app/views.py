@@ -1,35 +1,45 @@
+import json
 import uuid
+
+import httpx
 import requests
-import os
 
 from django.db import transaction
-from django.db.models import OuterRef, Subquery
-from django.http import HttpResponse, StreamingHttpResponse
-from django.utils.text import slugify
+from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, \
     RetrieveUpdateAPIView
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import permission_classes, api_view
+from django.views.decorators.http import require_http_methods, require_POST
 from rest_framework import status
 from django.shortcuts import render, get_object_or_404, redirect
 from rest_framework.views import APIView
-from django.db.models import Count
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db.models import Q
 from django.views.decorators.cache import cache_page
-from django.core.cache import cache
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import IsAdminUser
 
+from . import cache_versions
 from .forms import EditVideoForm
-from .models import TelegramUser, Video, WatchingHistory, Subscription, Payment, SlugWord, Tag
+from .models import TelegramUser, Video, Subscription, Payment, Tag
 from .serializers import VideoAddSerializer, UserSerializer, VideoGetSerializerBase, \
-    WatchingHistorySerializer, SubscriptionSerializer, TagsSerializer, VideoGetSerializerWithSlugwords, \
-    VideoGetSerializerWithTags
+    WatchEventSerializer, SubscriptionSerializer, TagsSerializer
+from .file_links import video_exists, avideo_exists
+from .history_stream import append_watch
 from .pagination import VideoCursorPagination, HistoryCursorPagination
-from .utils import higher_work_mem
-
-BOT_TOKEN = os.environ.get('BOT_TOKEN')
+from .popularity import record_hits, FEED_IMPRESSION, PROXY_HIT, WATCH
+from .autocomplete import suggest
+from .conditional import conditional_response
+from .response_cache import get_entry, cached_response
+from .search_cache import search_page
+from .telegram_api import get_client, get_async_client, TelegramAPIError, TelegramUnavailable
+from .view_counts import record_view
+from .video_cache import get_video_cache, load_size, aload_size, iter_range, aiter_range, parse_range, \
+    UpstreamError, VideoLink
 
 
 class VideoAddAPIPost(CreateAPIView):
@@ -54,13 +64,25 @@ class VideoAPIGet(ListAPIView):
     """
     serializer_class = VideoGetSerializerBase
     pagination_class = VideoCursorPagination
+    cache_timeout = 60 * 5
 
     def get_cache_key(self):
         """
-        Generate a unique cache key based on request parameters
+        Generate a unique cache key based on request parameters,
+        versioned by the feeds the response is built from
         """
         params = self.request.query_params.urlencode()
-        return f'video_get:{self.request.path}:{params}'
+        user_id = self.request.query_params.get('user')
+        user_ids = self.request.query_params.get('users')
+
+        if user_id:
+            namespaces = [cache_versions.user_videos(user_id)]
+        elif user_ids:
+            namespaces = [cache_versions.user_videos(telegram_id) for telegram_id in user_ids.split(',')]
+        else:
+            namespaces = [cache_versions.PUBLISHED_VIDEOS]
+
+        return cache_versions.versioned_key(f'video_get:{self.request.path}:{params}', *namespaces)
 
 
     def get_queryset(self):
@@ -82,37 +104,43 @@ class VideoAPIGet(ListAPIView):
             telegram_ids = user_ids.split(',')
             queryset = Video.published.filter(user__in=telegram_ids)
 
-        return queryset.order_by('-time_created')
+        return queryset.defer('search_vector').order_by('-time_created')
 
     def list(self, request, *args, **kwargs):
         """
         Handles pagination and response formatting.
+        Pages are cached with stampede protection, see response_cache,
+        and answered with 304 when the client has the same page.
         """
-        cache_key = self.get_cache_key()
-        cached_data = cache.get(cache_key)
+        entry = get_entry(self.get_cache_key(), self.build_response_data, self.cache_timeout)
+        self.record_impressions(entry['data'])
 
-        if cached_data:
-            return Response(cached_data)
+        return conditional_response(request, entry['data'], entry.get('etag'))
 
+    def build_response_data(self):
         queryset = self.get_queryset()
         page = self.paginate_queryset(queryset)
 
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            response = self.get_paginated_response(serializer.data)
-            response_data = response.data
-        else:
-            serializer = self.get_serializer(queryset, many=True)
-            response_data = serializer.data
+            return self.get_paginated_response(serializer.data).data
 
-        cache.set(cache_key, response_data, timeout=60 * 5)
+        serializer = self.get_serializer(queryset, many=True)
+        return serializer.data
 
-        return Response(response_data)
+    @staticmethod
+    def record_impressions(response_data):
+        """
+        Count every video of the returned page as a feed impression.
+        """
+        videos = response_data.get('results', []) if isinstance(response_data, dict) else response_data
+        record_hits([video['video_id'] for video in videos], FEED_IMPRESSION)
 
 
 class MyHistoryAPIGet(ListAPIView):
     """
     API endpoint to retrieve videos watched by a specific user, ordered by the most recent watch time.
+    Reads the per-user LastWatched table, so a page is one index range scan however long the history is.
     """
     serializer_class = VideoGetSerializerBase
     pagination_class = HistoryCursorPagination
@@ -121,22 +149,13 @@ class MyHistoryAPIGet(ListAPIView):
         telegram_id = self.request.query_params.get('user')
 
         if not telegram_id:
-            return Response({"error": "The 'user' query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
-        with higher_work_mem():
-            user = TelegramUser.objects.get(telegram_id=telegram_id)
-
-            if not user:
-                return Video.objects.none()
-
-            latest_watch_subquery = WatchingHistory.objects.filter(
-                user=user, video_id=OuterRef('video_id')
-            ).values('watched_at')
+            raise ValidationError({"error": "The 'user' query parameter is required."})
 
-            history = Video.objects.filter(watchinghistory__user=user).annotate(
-                watched_at=Subquery(latest_watch_subquery)).order_by('-watched_at')
-
-
-        return history
+        return (Video.objects
+                .filter(lastwatched__user=telegram_id)
+                .annotate(watched_at=F('lastwatched__last_watched'))
+                .defer('search_vector')
+                .select_related('user'))
 
 
 class UserAPIGet(RetrieveAPIView):
@@ -149,32 +168,50 @@ class UserAPIGet(RetrieveAPIView):
     cache_timeout = 60 * 10
 
     def get(self, request, *args, **kwargs):
-        cache_key = f'user_api_get_{kwargs["telegram_id"]}'
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
-
-        response = super().get(request, *args, **kwargs)
-        cache.set(cache_key, response.data, self.cache_timeout)
-
-        return response
+        cache_key = cache_versions.versioned_key(f'user_api_get_{kwargs["telegram_id"]}',
+                                                 cache_versions.user(kwargs['telegram_id']))
+        return cached_response(request, cache_key,
+                               lambda: super(UserAPIGet, self).get(request, *args, **kwargs).data,
+                               self.cache_timeout)
 
 
 class VideoAPIPatch(RetrieveUpdateAPIView):
     """
     API endpoint to update details of a specific video.
     """
-    queryset = Video.objects.all()
+    queryset = Video.objects.defer('search_vector')
     serializer_class = VideoGetSerializerBase
     lookup_field = 'video_id'
 
 
-class HistoryAddAPIPost(CreateAPIView):
+class ViewAddAPIPost(APIView):
+    """
+    API endpoint to count one view of a video.
+    The view is buffered in Redis and added to view_count by a periodic task.
+    """
+
+    def post(self, request, video_id, *args, **kwargs):
+        record_view(video_id)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+
+class HistoryAddAPIPost(APIView):
     """
     API endpoint to add a new entry to the watching history.
+    The entry is queued in a Redis stream and written to the database in batches by a periodic task.
+    Only existing videos gain heat, so arbitrary ids never take places in the hot set.
     """
-    queryset = WatchingHistory.objects.all()
-    serializer_class = WatchingHistorySerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = WatchEventSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        video_id = serializer.validated_data['video']
+
+        append_watch(serializer.validated_data['user'], video_id)
+        if video_exists(video_id):
+            record_hits([video_id], WATCH)
+
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
 
 class SubscriptionAPI(APIView):
@@ -187,25 +224,22 @@ class SubscriptionAPI(APIView):
         telegram_id = request.query_params.get('telegram_id')
         cache_timeout = 60 * 10
 
-        cache_key = f'subscriptions_{telegram_id}'
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data, status=status.HTTP_200_OK)
-
         if not telegram_id:
             return Response({'error': 'telegram_id query parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+        cache_key = cache_versions.versioned_key(f'subscriptions_{telegram_id}',
+                                                 cache_versions.subscriptions(telegram_id))
         try:
-            user = TelegramUser.objects.get(telegram_id=telegram_id)
+            return cached_response(request, cache_key, lambda: self.build_response_data(telegram_id), cache_timeout)
         except TelegramUser.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    @staticmethod
+    def build_response_data(telegram_id):
+        user = TelegramUser.objects.get(telegram_id=telegram_id)
         subscriptions = user.subscriptions_from.all()
 
-        subscriptions_data = SubscriptionSerializer(subscriptions, many=True).data
-        cache.set(cache_key, {'subscriptions': subscriptions_data}, cache_timeout)
-
-        return Response({'subscriptions': subscriptions_data}, status=status.HTTP_200_OK)
+        return {'subscriptions': SubscriptionSerializer(subscriptions, many=True).data}
 
     def post(self, request, *args, **kwargs):
         """
@@ -257,48 +291,84 @@ class SubscriptionAPI(APIView):
         return Response({'message': 'Subscription deleted successfully'}, status=status.HTTP_200_OK)
 
 
-class GetInvoiceAPI(APIView):
+def invoice_data(payment_id, video_id):
+    """ createInvoiceLink parameters of a like, which costs 1 Telegram star """
+    return {'title': 'Like',
+            'description': 'Like Video',
+            'payload': f'{payment_id}&&&{video_id}',
+            'provider_token': '',
+            'currency': 'XTR',
+            'prices': [{'label': 'Like', 'amount': 1}]}
+
+
+class GetInvoiceAPI(View):
     """
     API to obtain invoice url from telegram to continue payment
     The payment is for liking a video, with a cost of 1 Telegram star.
     """
 
     def get(self, request, *args, **kwargs):
-        url = f'https://api.telegram.org/bot{BOT_TOKEN}/createInvoiceLink'
         unique_id = uuid.uuid4()
-        user = request.query_params.get('user')
-        video_id = request.query_params.get('video')
+        user = request.GET.get('user')
+        video_id = request.GET.get('video')
 
         if not user or not video_id:
-            return Response({'error': 'Both user and video query parameters are required'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({'error': 'Both user and video query parameters are required'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        if not (TelegramUser.objects.filter(telegram_id=user).exists()
+                and Video.objects.filter(video_id=video_id).exists()):
+            return JsonResponse({'error': 'Invalid user or video ID'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            TelegramUser.objects.get(telegram_id=user)
-            Video.objects.get(video_id=video_id)
-        except (TelegramUser.DoesNotExist, Video.DoesNotExist):
-            return Response({'error': 'Invalid user or video ID'}, status=status.HTTP_404_NOT_FOUND)
-
-        invoice_data = {'title': 'Like',
-                        'description': 'Like Video',
-                        'payload': f'{unique_id}&&&{video_id}',
-                        'provider_token': '',
-                        'currency': 'XTR',
-                        'prices': [{'label': 'Like', 'amount': 1}]}
+            invoice_link = get_client().call('createInvoiceLink', **invoice_data(unique_id, video_id))
+        except TelegramUnavailable as e:
+            return JsonResponse({'error': 'API request failed', 'details': str(e)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except TelegramAPIError as e:
+            return JsonResponse({'error': 'Failed to generate invoice link', 'details': str(e)},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        if invoice_link:
+            Payment.objects.create(user_id=user, payment_id=unique_id)
+            return JsonResponse({'invoice_link': invoice_link}, status=status.HTTP_200_OK)
+        else:
+            return JsonResponse({'error': 'Failed to generate invoice link'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncGetInvoiceAPI(View):
+    """
+    Async version of GetInvoiceAPI, routed under ASGI only (VideoEm.asgi_urls):
+    the event loop is not blocked while Telegram creates the invoice.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        unique_id = uuid.uuid4()
+        user = request.GET.get('user')
+        video_id = request.GET.get('video')
+
+        if not user or not video_id:
+            return JsonResponse({'error': 'Both user and video query parameters are required'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        if not (await TelegramUser.objects.filter(telegram_id=user).aexists()
+                and await Video.objects.filter(video_id=video_id).aexists()):
+            return JsonResponse({'error': 'Invalid user or video ID'}, status=status.HTTP_404_NOT_FOUND)
 
         try:
-            response = requests.post(url, json=invoice_data)
-            response_data = response.json()
-            invoice_link = response_data.get('result')
-            if invoice_link:
-                Payment.objects.create(user_id=user, payment_id=unique_id)
-                return Response({'invoice_link': invoice_link}, status=status.HTTP_200_OK)
-            else:
-                return Response({'error': 'Failed to generate invoice link', 'details': response_data},
+            invoice_link = await get_async_client().call('createInvoiceLink', **invoice_data(unique_id, video_id))
+        except TelegramUnavailable as e:
+            return JsonResponse({'error': 'API request failed', 'details': str(e)},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except TelegramAPIError as e:
+            return JsonResponse({'error': 'Failed to generate invoice link', 'details': str(e)},
                                 status=status.HTTP_400_BAD_REQUEST)
-        except requests.exceptions.RequestException as e:
-            return Response({'error': 'API request failed', 'details': str(e)},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if invoice_link:
+            await Payment.objects.acreate(user_id=user, payment_id=unique_id)
+            return JsonResponse({'invoice_link': invoice_link}, status=status.HTTP_200_OK)
+        else:
+            return JsonResponse({'error': 'Failed to generate invoice link'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RegisterAPI(APIView):
@@ -328,52 +398,38 @@ class RegisterAPI(APIView):
 
 class SearchAPI(APIView):
     """
-    API endpoint to search videos by title.
-    Requires the 'q' query parameter.
+    API endpoint to search videos.
+    'q' - full-text search over title, tags and description of published videos, best matches first.
+    'tags' - published videos having all of the comma separated tags, newest first.
+    Results are cached, see search_cache. Answers with 304 when the client already has the same results.
     """
-    pagination_class = VideoCursorPagination
 
     def get(self, request, *args, **kwargs):
         query = request.query_params.get('q', '')
         query_tags = request.query_params.get('tags', '')
-        with higher_work_mem():
-
-            if query:  # for simple search
-                query_slug = slugify(query)
-                query_words = set(word for word in query_slug.split('-') if word)
-
-                if not query_words:
-                    return Response([], status=status.HTTP_400_BAD_REQUEST)
-
-                matched_words = SlugWord.objects.filter(word__in=query_words)
+        if query.strip():  # for full-text search
+            return conditional_response(request, search_page(request, query=query))
 
-                videos = Video.objects.filter(slug_words__in=matched_words).distinct().prefetch_related('slug_words')
-                videos = videos.annotate(match_count=Count('slug_words')).order_by('-match_count', '-time_published')
+        elif query_tags:  # for tag search
+            return conditional_response(request, search_page(request, tags=query_tags.split(',')))
 
-                paginator = VideoCursorPagination()
-                paginated_videos = paginator.paginate_queryset(videos, request)
-
-                serializer = VideoGetSerializerWithSlugwords(paginated_videos, many=True)
-
-                return paginator.get_paginated_response(serializer.data)
-
-            elif query_tags:  # for tag search
-
-                tags_list = query_tags.split(',')
-
-                queryset = (Video.objects.annotate(video_tags=ArrayAgg('tags__tag'))
-                            .filter(Q(video_tags__contains=tags_list))
-                            .prefetch_related('tags'))
+        else:
+            return Response([], status=status.HTTP_400_BAD_REQUEST)
 
-                paginator = VideoCursorPagination()
-                paginated_videos = paginator.paginate_queryset(queryset, request)
 
-                serializer = VideoGetSerializerWithTags(paginated_videos, many=True)
+class AutocompleteAPIGet(APIView):
+    """
+    API endpoint to suggest tags and video titles while the user types.
+    Requires the 'q' query parameter, 'limit' is optional.
+    """
 
-                return paginator.get_paginated_response(serializer.data)
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'must be an integer'})
 
-            else:
-                return Response([], status=status.HTTP_400_BAD_REQUEST)
+        return conditional_response(request, suggest(request.query_params.get('q', ''), max(limit, 1)))
 
 
 class TagsAPICreate(CreateAPIView):
@@ -393,80 +449,145 @@ class TagsAPIGet(ListAPIView):
     cache_timeout = 60 * 10
 
     def get(self, request, *args, **kwargs):
-        cache_key = 'tags_api_get'
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            return Response(cached_data)
+        cache_key = cache_versions.versioned_key('tags_api_get', cache_versions.TAGS)
+        return cached_response(request, cache_key,
+                               lambda: super(TagsAPIGet, self).get(request, *args, **kwargs).data,
+                               self.cache_timeout)
 
-        response = super().get(request, *args, **kwargs)
-        cache.set(cache_key, response.data, self.cache_timeout)
 
-        return response
+class CacheStatsAPI(APIView):
+    """
+    API endpoint to retrieve hit ratios of the cache tiers in the process serving the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        stats = {alias: caches[alias].stats() for alias in settings.CACHES
+                 if hasattr(caches[alias], 'stats')}
+        return Response(stats, status=status.HTTP_200_OK)
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def index(request):
     return render(request, 'video_app/index.html')
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def main(request):
     return render(request, 'video_app/main.html', {"show_back_button": False})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def account(request):
     return render(request, 'video_app/account.html', {"show_back_button": True})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def page_not_found(request, exception):
     return render(request, 'video_app/404.html', {"show_back_button": True})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def subscriptions(request):
     return render(request, 'video_app/subscriptions.html', {"show_back_button": True})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def search(request):
     return render(request, 'video_app/search.html', {"show_back_button": True})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def tag_search(request):
     return render(request, 'video_app/tag_search.html', {"show_back_button": True})
 
 
-def proxy_video(request):
+def range_response(request, byte_range, total, stream):
     """
-    Proxy for video links to handle cross-origin restrictions.
-    Requires 'video_url' as a query parameter.
+    Response to a GET or HEAD of byte_range in a video of total bytes: 416 when the range cannot
+    be satisfied, 206 for a range, 200 for the whole video.
+    stream(start, end) returns the body iterator, a generator or an async generator matching the view.
     """
-    video_url = request.GET.get('video_url')
+    requested = parse_range(byte_range, total)
+    if requested is False:
+        video_response = HttpResponse(status=416)
+        # no body, only the size of the video for the client to retry with
+        video_response['Content-Length'] = 0
+        video_response['Content-Range'] = f'bytes */{total}'
+        return video_response
+
+    start, end = requested or (0, total - 1)
+    response_status = 206 if requested else 200
+
+    if request.method == 'HEAD':
+        video_response = HttpResponse(status=response_status, content_type='video/mp4')
+    else:
+        video_response = StreamingHttpResponse(stream(start, end), status=response_status, content_type='video/mp4')
 
-    if not video_url:
-        return HttpResponse("Missing 'video_url' parameter", status=400)
+    video_response['Content-Length'] = end - start + 1
+    video_response['Accept-Ranges'] = 'bytes'
+    if requested:
+        video_response['Content-Range'] = f'bytes {start}-{end}/{total}'
+    video_response['Content-Disposition'] = 'inline; filename="video.mp4"'
+    video_response['Access-Control-Allow-Origin'] = '*'
+    video_response['Access-Control-Expose-Headers'] = 'Content-Length, Content-Range, Accept-Ranges'
+    return video_response
 
+
+@require_http_methods(['GET', 'HEAD'])
+def proxy_video(request, video_id):
+    """
+    Stream a video by its video_id through the on-disk segment cache, 404 for an unknown video.
+    The Telegram download link is resolved on the server and renewed when it expires,
+    so clients never see or pass temporary links.
+    The client's Range header is honoured, so seeking and previews fetch only the bytes
+    the player reads (206 with Content-Range). HEAD returns the headers without the body.
+    """
+    if not video_exists(video_id):
+        return HttpResponse("Video not found", status=404)
+
+    byte_range = request.META.get('HTTP_RANGE', '')
+
+    if byte_range in ('', 'bytes=0-') and request.method == 'GET':
+        record_hits([video_id], PROXY_HIT)
+
+    video_cache = get_video_cache()
+    link = VideoLink(video_id)
     try:
-        response = requests.get(video_url, stream=True)
-        response.raise_for_status()
+        total = load_size(video_cache, link)
+    except (requests.exceptions.RequestException, UpstreamError) as e:
+        return HttpResponse(f"Error fetching video: {str(e)}", status=502)
 
-        video_response = StreamingHttpResponse(
-            response.iter_content(chunk_size=8192),
-            content_type='video/mp4'
-        )
+    return range_response(request, byte_range, total, lambda start, end: iter_range(
+        video_cache, link, start, end, total, settings.PROXY_VIDEO_CHUNK_SIZE))
 
-        video_response['Content-Disposition'] = 'inline; filename="video.mp4"'
-        video_response['Access-Control-Allow-Origin'] = '*'
-        return video_response
 
-    except requests.exceptions.RequestException as e:
-        return HttpResponse(f"Error fetching video: {str(e)}", status=500)
+@require_http_methods(['GET', 'HEAD'])
+async def aproxy_video(request, video_id):
+    """
+    Async version of proxy_video, routed under ASGI only (VideoEm.asgi_urls):
+    a stream holds no worker while it waits on Telegram or on the client.
+    """
+    if not await avideo_exists(video_id):
+        return HttpResponse("Video not found", status=404)
 
+    byte_range = request.META.get('HTTP_RANGE', '')
 
-@cache_page(60 * 10)
+    if byte_range in ('', 'bytes=0-') and request.method == 'GET':
+        await sync_to_async(record_hits, thread_sensitive=False)([video_id], PROXY_HIT)
+
+    video_cache = get_video_cache()
+    link = VideoLink(video_id)
+    try:
+        total = await aload_size(video_cache, link)
+    except (httpx.HTTPError, UpstreamError) as e:
+        return HttpResponse(f"Error fetching video: {str(e)}", status=502)
+
+    return range_response(request, byte_range, total, lambda start, end: aiter_range(
+        video_cache, link, start, end, total, settings.PROXY_VIDEO_CHUNK_SIZE))
+
+
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def edit_video(request, video_id):
     instance = get_object_or_404(Video.objects.prefetch_related('tags'), video_id=video_id)
 
@@ -486,7 +607,7 @@ def edit_video(request, video_id):
     return render(request, 'video_app/edit_video.html', {'form': form, 'video': instance, "show_back_button": True})
 
 
-@cache_page(60 * 10)
+@cache_page(60 * 10, cache=settings.PAGE_CACHE_ALIAS)
 def view_video(request, video_slug):
     instance = get_object_or_404(Video, video_slug=video_slug)
 
@@ -497,9 +618,15 @@ def view_video(request, video_slug):
                                                          'tags': tags})
 
 
+def parse_pre_checkout(update):
+    """ pre_checkout_query id, paying user id, payment id and video id of a webhook update """
+    query = update['pre_checkout_query']
+    payment_id, video_id = query['invoice_payload'].split("&&&")[:2]
+    return query['id'], query['from']['id'], uuid.UUID(payment_id), video_id
+
+
 @csrf_exempt
-@api_view(['POST'])
-@permission_classes([AllowAny])
+@require_POST
 def telegram_webhook(request):
     """
     Handle requests from telegram to server
@@ -508,44 +635,68 @@ def telegram_webhook(request):
     This request from telegram contain payload information which can be used to verify
     payment and make corresponding changes in DB.
     """
-    update = request.data
+    try:
+        update = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"status": "fail", "error": "Malformed update"})
 
     if 'pre_checkout_query' in update:
         try:
-            pre_checkout_query_id = update['pre_checkout_query']['id']
-            url = f"https://api.telegram.org/bot{BOT_TOKEN}/answerPreCheckoutQuery"
+            pre_checkout_query_id, user_id, payment_id, video_id = parse_pre_checkout(update)
+            get_client().call('answerPreCheckoutQuery', pre_checkout_query_id=pre_checkout_query_id, ok=True)
+            return JsonResponse(confirm_payment(user_id, payment_id, video_id))
+
+        except Exception as e:
+            return JsonResponse({"status": "fail", "error": str(e)})
+    else:
+        return JsonResponse({"status": "ok"})
+
 
-            requests.post(url, data={"pre_checkout_query_id": pre_checkout_query_id, "ok": True})
+@csrf_exempt
+@require_POST
+async def atelegram_webhook(request):
+    """
+    Async version of telegram_webhook, routed under ASGI only (VideoEm.asgi_urls).
+    """
+    try:
+        update = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"status": "fail", "error": "Malformed update"})
 
-            user_id = update['pre_checkout_query']['from']['id']
-            invoice_payload = update['pre_checkout_query']['invoice_payload']
-            parts = invoice_payload.split("&&&")
+    if 'pre_checkout_query' in update:
+        try:
+            pre_checkout_query_id, user_id, payment_id, video_id = parse_pre_checkout(update)
+            await get_async_client().call('answerPreCheckoutQuery', pre_checkout_query_id=pre_checkout_query_id,
+                                          ok=True)
+            return JsonResponse(await sync_to_async(confirm_payment)(user_id, payment_id, video_id))
 
-            video_id = parts[1]
-            payment_id = uuid.UUID(parts[0])
+        except Exception as e:
+            return JsonResponse({"status": "fail", "error": str(e)})
+    else:
+        return JsonResponse({"status": "ok"})
 
-            try:
-                payment = Payment.objects.get(user=user_id, payment_id=payment_id)
-            except Payment.DoesNotExist:
-                return Response({"status": "fail", "error": "Payment record not found"})
 
-            try:
-                video = Video.objects.get(video_id=video_id)
-            except Video.DoesNotExist:
-                return Response({"status": "fail", "error": "Video not found"})
+def confirm_payment(user_id, payment_id, video_id):
+    """
+    Mark a pending payment as paid and add its star to the video.
+    """
+    try:
+        payment = Payment.objects.get(user=user_id, payment_id=payment_id)
+    except Payment.DoesNotExist:
+        return {"status": "fail", "error": "Payment record not found"}
 
-            if payment.status == "paid":
-                return Response({"status": "fail", "error": "Payment already processed"})
+    try:
+        video = Video.objects.get(video_id=video_id)
+    except Video.DoesNotExist:
+        return {"status": "fail", "error": "Video not found"}
 
-            with transaction.atomic():
-                video.stars += 1
-                video.save()
-                payment.status = "paid"
-                payment.save()
+    if payment.status == "paid":
+        return {"status": "fail", "error": "Payment already processed"}
 
-            return Response({"status": "success"})
+    with transaction.atomic():
+        video.stars += 1
+        video.save()
+        payment.status = "paid"
+        payment.save()
 
-        except Exception as e:
-            return Response({"status": "fail", "error": str(e)})
-    else:
-        return Response({"status": "ok"})
+    return {"status": "success"}